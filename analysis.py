@@ -0,0 +1,84 @@
+import re
+
+import profiling
+
+# the punctuation which splits the words, every character is mapped to a space
+PUNCTUATION = ".(),?$%^*:\"'/-+——！，。？、~@#￥%……&*（）"
+# the character map of str.translate, one C pass over the text in place of a regular expression
+_TABLE = str.maketrans(dict.fromkeys(PUNCTUATION, ' '))
+# the profiler stages of the analysis k:pipeline v:(tokenize,stopwords,stemming)
+STAGES = {pipeline: tuple('{}.{}'.format(pipeline, step) for step in ('tokenize', 'stopwords', 'stemming'))
+          for pipeline in ('index', 'query')}
+# a quoted phrase of a query, "information retrieval", and with ~N the words in any order with at most
+# N other words between them, "information retrieval"~5
+PHRASE = re.compile(r'"([^"]*)"(?:~(\d+))?')
+
+
+def split_phrases(text):
+    """
+    take the phrase and the proximity clauses out of a query
+    :param text: the text of the query
+    :return: the text with the quotes and the ~N taken away, the words of the clauses stay in it,
+             and a list of (the text of the clause, None for a phrase or the N of the proximity)
+    """
+    clauses = [(match.group(1), None if match.group(2) is None else int(match.group(2)))
+               for match in PHRASE.finditer(text)]
+    return PHRASE.sub(lambda match: ' {} '.format(match.group(1)), text), clauses
+
+
+# a required word of a query, +retrieval
+REQUIRED = re.compile(r'(?<!\S)\+([^\s"]+)')
+
+
+def split_required(text):
+    """
+    take the required words out of a query
+    :param text: the text of the query
+    :return: the text with the + taken away, the required words stay in it, and the list of the required words
+    """
+    return REQUIRED.sub(r'\1', text), REQUIRED.findall(text)
+
+
+class Analyzer(object):
+    """Summary of Analyzer here
+    turn a text into its terms, the same way for the documents and the queries
+    the text is split at the punctuation and the white space and lower cased, the stopwords are dropped,
+    the other words are stemmed through the stem cache and the stems which are stopwords are dropped too,
+    so neither 'this' nor its stem 'thi' becomes a term
+        analyzer = Analyzer(stem_cache, stopwords)
+        terms = analyzer.analyze("The Library of Congress")
+    the index and the queries share an analyzer, so a query word always meets the term its document got
+    """
+
+    def __init__(self, stem_cache, stopwords):
+        # the memoized stemmer, the indexing adds the words of the collection to its vocabulary map
+        self.stem_cache = stem_cache
+        # the set of the stopwords, they are compared with the words and with the stems
+        self.stopwords = stopwords
+
+    def tokenize(self, text):
+        """
+        split a text into the lower case words
+        :param text: the text
+        :return: the list of the words, without the punctuation and the empty words
+        """
+        # str.split() splits at the same white space as \s+ and drops the empty words
+        return text.translate(_TABLE).lower().split()
+
+    def analyze(self, text, remember=False, pipeline='query'):
+        """
+        the terms of a text in the order of its words, a repeated word gives its term again
+        :param text: the text of a document or a query
+        :param remember: True while indexing, the new words are added to the vocabulary map of the stem cache
+        :param pipeline: 'index' or 'query', the prefix of the profiler stages of the steps
+        :return: the list of the terms
+        """
+        tokenize, filtering, stemming = STAGES[pipeline]
+        stopwords = self.stopwords
+        with profiling.PROFILER.stage(tokenize):
+            words = self.tokenize(text)
+        with profiling.PROFILER.stage(filtering):
+            words = [word for word in words if word not in stopwords]
+        # the stems which are stopwords are dropped with the stemming
+        with profiling.PROFILER.stage(stemming):
+            return [stem for stem in self.stem_cache.stem_many(words, remember) if stem not in stopwords]
@@ -0,0 +1,3 @@
+"""the benchmarks of the index build, the index load, the query latency and the memory, run them with
+    python -m benchmarks.run --help
+"""
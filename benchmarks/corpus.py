@@ -0,0 +1,90 @@
+import random
+from collections import Counter
+from itertools import accumulate
+
+# the line which ends every document of the LISA format
+SEPARATOR = '********************************************\n'
+
+
+def read_documents(path):
+    """
+    read the documents of a corpus in the LISA format
+    :param path: the path of the corpus
+    :return: a list of (docid, the text of the document without its Document line)
+    """
+    with open(path) as f:
+        text = f.read()
+    documents = []
+    for doc in text.split(SEPARATOR):
+        if not doc.strip():
+            continue
+        head, _, body = doc.partition('\n')
+        documents.append((int(head.split('Document')[1]), body))
+    return documents
+
+
+def _write(path, bodies):
+    """
+    write the bodies as the documents 1..n of a corpus in the LISA format
+    :param path: the path of the corpus
+    :param bodies: an iterable of the texts of the documents
+    :return: the number of the documents written
+    """
+    count = 0
+    with open(path, 'w') as f:
+        for count, body in enumerate(bodies, 1):
+            f.write("Document {:>4}\n{}{}".format(count, body, SEPARATOR))
+    return count
+
+
+def replicate(source, path, scale):
+    """
+    scale a corpus by writing its documents again and again under the new docids
+    the vocabulary and the statistics of the terms stay the ones of the source
+    :param source: the path of the source corpus
+    :param path: the path of the scaled corpus
+    :param scale: the size of the scaled corpus in the source sizes, it can be a fraction
+    :return: the number of the documents written
+    """
+    documents = read_documents(source)
+    total = max(1, int(round(len(documents) * scale)))
+    return _write(path, (documents[i % len(documents)][1] for i in range(total)))
+
+
+def zipf(source, path, scale, seed=0, exponent=1.0):
+    """
+    generate a corpus whose words follow Zipf's law over the vocabulary of the source,
+    the word of rank r is drawn with the probability 1/r**exponent and the lengths of the
+    documents are drawn from the lengths of the source documents
+    unlike replicate the posting lists are not copies of each other, so the skipping and the
+    compression see the gaps of a real collection
+    :param source: the path of the source corpus
+    :param path: the path of the generated corpus
+    :param scale: the size of the generated corpus in the source sizes, it can be a fraction
+    :param seed: the seed of the generator, the same seed gives the same corpus
+    :param exponent: the exponent of the law
+    :return: the number of the documents written
+    """
+    documents = read_documents(source)
+    counts = Counter()
+    lengths = []
+    for docid, body in documents:
+        words = body.split()
+        counts.update(words)
+        lengths.append(len(words))
+    vocabulary = [word for word, count in counts.most_common()]
+    weights = list(accumulate(1.0 / rank ** exponent for rank in range(1, len(vocabulary) + 1)))
+    rng = random.Random(seed)
+    total = max(1, int(round(len(documents) * scale)))
+
+    def bodies():
+        for _ in range(total):
+            words = rng.choices(vocabulary, cum_weights=weights, k=rng.choice(lengths))
+            # the parser joins the lines of a document without a space, so a document is one line
+            yield ' '.join(words) + '\n'
+
+    return _write(path, bodies())
+
+
+# the generators of a scaled corpus
+GENERATORS = ('replicate', 'zipf')
@@ -0,0 +1,221 @@
+"""the benchmark of the index build, the index load, the query latency and the peak memory
+every scale of the corpus runs in a new process in a temporary directory, so the index files of the
+working directory are never touched and the peak RSS of a scale doesn't include the ones before it
+
+    python -m benchmarks.run --scales=1,2,4 --generator=zipf --output=before.json
+"""
+import contextlib
+import getopt
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cache
+import profiling
+import search
+from benchmarks import corpus
+
+# the root of the repository, the LISA files and the stopwords are read from it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LISA = os.path.join(ROOT, 'lisa', 'lisa.all.txt')
+QUERIES = os.path.join(ROOT, 'lisa', 'lisa.queries.txt')
+STOPWORDS = os.path.join(ROOT, 'stopwords.txt')
+
+
+def percentile(values, p):
+    """
+    the nearest rank percentile
+    :param values: a list of the numbers
+    :param p: the percentile between 0 and 100
+    :return: the smallest value which is not less than p percent of the values
+    """
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def latency(seconds):
+    """
+    summarize the latencies of the queries
+    :param seconds: a list of the latencies in seconds
+    :return: a dict of the mean, p50, p95, p99 and max in milliseconds
+    """
+    ms = [second * 1000 for second in seconds]
+    return {'mean': sum(ms) / len(ms), 'p50': percentile(ms, 50), 'p95': percentile(ms, 95),
+            'p99': percentile(ms, 99), 'max': max(ms)}
+
+
+def peak_rss_kb():
+    """
+    the peak resident set size of this process
+    :return: the size in kilobytes
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux gives kilobytes, macOS gives bytes
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_scale(settings):
+    """
+    benchmark a scale of the corpus in a temporary directory
+    :param settings: the dict of the benchmark settings and the scale
+    :return: a dict of the results
+    """
+    workdir = tempfile.mkdtemp(prefix='bm25bench')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        path = os.path.join(workdir, 'corpus.txt')
+        if settings['generator'] == 'zipf':
+            docs = corpus.zipf(LISA, path, settings['scale'], settings['seed'])
+        else:
+            docs = corpus.replicate(LISA, path, settings['scale'])
+
+        s = search.search()
+        s.all_path = path
+        s.stopwords_path = STOPWORDS
+        s.evaluator = settings['evaluator']
+        s.workers = settings['workers']
+        s.weights = settings['weights']
+        s.memory_budget = settings['memory_budget']
+        # every query is scored, the result cache would only measure the dict lookups
+        s.result_cache = cache.LRUCache(0)
+        profiling.PROFILER.enabled = settings['profile']
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            # there is no index in the directory, so the first load builds it
+            start = time.perf_counter()
+            s._load_model()
+            build = time.perf_counter() - start
+            start = time.perf_counter()
+            s._load_model()
+            load = time.perf_counter() - start
+
+        e = search.evaluation()
+        e.sample_query_file = QUERIES
+        queries = [words for id, words in e.process_example_query()]
+        passes = []
+        for _ in range(settings['repeat']):
+            seconds = []
+            for query_words in queries:
+                start = time.perf_counter()
+                s._query_result(query_words, settings['k'])
+                seconds.append(time.perf_counter() - start)
+            passes.append(seconds)
+
+        return {'scale': settings['scale'], 'docs': docs, 'corpus_bytes': os.path.getsize(path),
+                'build_seconds': build, 'docs_per_second': docs / build,
+                'index_bytes': os.path.getsize(os.path.join(workdir, search.BM25.index_files[settings['weights']])),
+                'load_seconds': load, 'queries': len(queries),
+                # the first pass decodes the posting lists, the later ones find them in the cache
+                'latency_ms': {'cold': latency(passes[0]),
+                               'warm': latency([second for seconds in passes[1:] for second in seconds])
+                               if len(passes) > 1 else None},
+                'peak_rss_kb': peak_rss_kb(),
+                'stages': profiling.PROFILER.summary() if settings['profile'] else None}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def commit():
+    """
+    the git commit of the repository, so the runs can be compared across the commits
+    :return: the commit hash, None if it is not a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def helper_msg():
+    print("usage:")
+    print("python -m benchmarks.run [options]")
+    print("options:")
+    print("--scales=1,2,4              the sizes of the corpus in the LISA sizes, 1 by default")
+    print("--generator=replicate|zipf  copy the LISA documents or draw Zipfian words from the LISA vocabulary")
+    print("--seed=N                    the seed of the zipf generator, 0 by default")
+    print("-e taat|wand|maxscore|bmw|sparse  the query evaluator, taat by default")
+    print("-k N                        the number of the results of a query, 40 by default")
+    print("--repeat=N                  the passes over the queries, the first is cold, 3 by default")
+    print("-w N                        build the index with N processes, 1 by default")
+    print("--raw-stats                 build the index of the raw statistics")
+    print("--memory-budget=MB          build the index out of core with MB megabytes of postings in memory")
+    print("--profile                   add the time of every stage of the indexing and the querying")
+    print("--output=FILE               the JSON file of the results, benchmark_results.json by default")
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "-h-e:-k:-w:", ["scales=", "generator=", "seed=", "repeat=",
+                                                         "raw-stats", "profile", "output=",
+                                                         "memory-budget="])
+    except getopt.GetoptError:
+        helper_msg()
+        sys.exit(2)
+    settings = {'generator': 'replicate', 'seed': 0, 'evaluator': 'taat', 'k': 40, 'repeat': 3,
+                'workers': 1, 'weights': 'bm25', 'profile': False, 'memory_budget': 0}
+    scales = [1.0]
+    output = 'benchmark_results.json'
+    try:
+        for opt, arg in opts:
+            if opt == '-h':
+                helper_msg()
+                return
+            elif opt == '--scales':
+                scales = [float(scale) for scale in arg.split(',')]
+                if min(scales) <= 0:
+                    raise ValueError
+            elif opt == '--generator':
+                if arg not in corpus.GENERATORS:
+                    raise ValueError
+                settings['generator'] = arg
+            elif opt == '-e':
+                if arg not in search.search().evaluators:
+                    raise ValueError
+                settings['evaluator'] = arg
+            elif opt == '--raw-stats':
+                settings['weights'] = 'tf'
+            elif opt == '--profile':
+                settings['profile'] = True
+            elif opt == '--output':
+                output = arg
+            else:
+                value = int(arg)
+                if value < (0 if opt == '--seed' else 1):
+                    raise ValueError
+                settings[{'--seed': 'seed', '-k': 'k', '--repeat': 'repeat', '-w': 'workers',
+                          '--memory-budget': 'memory_budget'}[opt]] = value
+    except ValueError:
+        print("Can't use the value of the option you have typed")
+        helper_msg()
+        sys.exit(2)
+
+    runs = []
+    # a new process for every scale, the peak RSS is the one of that scale alone
+    context = multiprocessing.get_context('spawn')
+    for scale in scales:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_scale, (dict(settings, scale=scale),))
+        runs.append(result)
+        print("scale {scale:g}: {docs} docs, build {build_seconds:.2f}s ({docs_per_second:.0f} docs/s), "
+              "load {load_seconds:.3f}s, cold p50/p95/p99 {cold[p50]:.2f}/{cold[p95]:.2f}/{cold[p99]:.2f} ms, "
+              "peak RSS {peak_rss_kb} KB".format(cold=result['latency_ms']['cold'], **result))
+
+    report = {'commit': commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'cpus': os.cpu_count(), 'settings': settings, 'runs': runs}
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("The results are saved to {}".format(output))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,467 @@
+import array
+import functools
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from collections.abc import Mapping
+
+import compression
+
+# the first bytes of every index file
+MAGIC = b'BM25IDX\x00'
+# the version of the layout below, bumped on every incompatible change
+# 4: the terms come from analysis.Analyzer, a word is dropped when it or its stem is a stopword
+FORMAT_VERSION = 4
+
+# what the posting scores hold
+#   bm25  the BM25 weights computed with the k and b of the header
+#   tf    the raw term frequencies, the weights are computed when the query runs
+WEIGHTS = ('bm25', 'tf')
+
+# the header: magic, version, block size, the docid codec, the score quantizer bits, the weights,
+# the quantizer low and step, the k and b of the formula, the average document length,
+# the number of the documents parsed, then the counts and the offset of every section
+#   the counts: docs, terms, postings, blocks
+#   the sections: doc table, doc lengths, term offsets, term blob, term postings start,
+#                 term docid bytes start, term blocks start, term max score, term document frequency,
+#                 posting docids, posting scores, block last docids, block max scores
+# the doc lengths and the document frequencies are only written with the tf weights
+HEADER = struct.Struct('<8sIIBBB5xdddddQ4Q13Q')
+
+
+class IndexFormatError(ValueError):
+    """Summary of IndexFormatError here
+    raised when a file is not a binary BM25 index or has another version of the format
+    """
+
+
+def invert(weights):
+    """
+    invert the docid -> term -> score dict into the term -> (docid,score) postings
+    every posting list is sorted by the docid so it can be merged or skipped later
+    :param weights: the BM25 dict k:docid (int or the string from the json) v:{k:term,v:score}
+    :return: the postings dict k:term v:list of (docid,score)
+    """
+    postings = {}
+    for docid, value in weights.items():
+        # the json file store the docid as a string
+        docid = int(docid)
+        for term, score in value.items():
+            if term in postings:
+                postings[term].append((docid, score))
+            else:
+                postings[term] = [(docid, score)]
+    # keep every posting list in the docid order
+    for plist in postings.values():
+        plist.sort(key=lambda posting: posting[0])
+    return postings
+
+
+def _pad(f):
+    """
+    pad the file to the next 8 bytes so every section is aligned
+    :param f: the file opened for writing
+    :return: the offset of the next section
+    """
+    offset = f.tell()
+    if offset % 8:
+        f.write(b'\x00' * (8 - offset % 8))
+    return f.tell()
+
+
+def _write_array(f, typecode, values):
+    """
+    write the values as a little endian array section
+    :param f: the file opened for writing
+    :param typecode: the array typecode
+    :param values: the values to write
+    :return: the offset of the section
+    """
+    offset = _pad(f)
+    data = array.array(typecode, values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    f.write(data.tobytes())
+    return offset
+
+
+def write_index(path, docids, postings, block_size=64, codec='raw', quant_bits=0,
+                weights='bm25', k=1, b=0.75, stats=None):
+    """
+    write the postings to the binary index file
+    the terms are sorted so they can be found with a binary search right from the mapped file
+    :param path: the path of the index file
+    :param docids: the ids of every document of the collection
+    :param postings: the inverted index k:term v:list of (docid,score) sorted by docid
+    :param block_size: the number of the postings in a block
+    :param codec: the codec of the docids, one of compression.CODECS
+    :param quant_bits: the bits of a quantized score, 0 keeps the exact scores
+    :param weights: 'bm25' if the scores are the BM25 weights, 'tf' if they are the term frequencies
+    :param k: the k of the formula the weights were computed with
+    :param b: the b of the formula the weights were computed with
+    :param stats: the statistics of the collection, needed with the tf weights, a dict of
+                  'docs': the number of the documents parsed, 'average_doclen': the average document length,
+                  'doclens': k:docid v:the document length, and for a shard of a collection
+                  'dfs': k:term v:the document frequency in the whole collection,
+                  'score_range': (the smallest score, the largest score) of the whole collection for the quantizer
+    :return: None
+    """
+    with IndexWriter(path, docids, block_size, codec, quant_bits, weights, k, b, stats) as writer:
+        for term in sorted(postings, key=lambda term: term.encode('utf-8')):
+            writer.add(term, postings[term])
+
+
+class IndexWriter(object):
+    """Summary of IndexWriter here
+    write a binary index file from the posting lists given one term at a time,
+    the terms must come in the order of their utf-8 bytes
+    only the tables of the terms and of the blocks are kept in memory, the docids and the scores
+    of the postings go to the temporary files next to the index and are copied into it on close,
+    so an index larger than the memory can be written from a merge of the sorted runs
+    the scores are quantized on close, when the smallest and the largest score are known
+        with IndexWriter(path, docids) as writer:
+            writer.add(term, plist)
+    """
+
+    # the number of the scores quantized at once on close
+    CHUNK = 1 << 16
+
+    def __init__(self, path, docids, block_size=64, codec='raw', quant_bits=0,
+                 weights='bm25', k=1, b=0.75, stats=None):
+        if codec not in compression.CODECS:
+            raise ValueError("unknown codec {}".format(codec))
+        if weights not in WEIGHTS:
+            raise ValueError("unknown weights {}".format(weights))
+        if weights == 'tf' and (stats is None or quant_bits != 0):
+            raise ValueError("the tf weights need the statistics of the collection and can't be quantized")
+        self.path = path
+        self.docids = sorted(docids)
+        self.block_size = block_size
+        self.codec = codec
+        self.quant_bits = quant_bits
+        self.weights = weights
+        self.k = k
+        self.b = b
+        self.stats = stats
+        # the tables of the terms
+        self.last = None
+        self.term_offsets = [0]
+        self.blob = bytearray()
+        self.post_start = [0]
+        self.doc_start = [0]
+        self.block_start = [0]
+        self.dfs = array.array('I')
+        # the document frequencies of the whole collection when the index is a shard of it
+        self.collection_dfs = stats.get('dfs') if stats else None
+        # the max scores before the quantization
+        self.max_scores = []
+        self.block_lasts = array.array('I')
+        self.block_maxes = []
+        # the smallest and the largest score, they fit the quantizer
+        self.low = float('inf')
+        self.high = float('-inf')
+        # the encoded docids and the exact scores of the postings
+        directory = os.path.dirname(os.path.abspath(path))
+        self.doc_data = tempfile.TemporaryFile(dir=directory)
+        self.score_data = tempfile.TemporaryFile(dir=directory)
+        self.doc_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.doc_data.close()
+            self.score_data.close()
+        return False
+
+    def add(self, term, plist):
+        """
+        add the posting list of a term
+        :param term: the term, after the terms already added in the order of the utf-8 bytes
+        :param plist: the list of (docid,score) sorted by docid
+        :return: None
+        """
+        encoded_term = term.encode('utf-8')
+        if self.last is not None and encoded_term <= self.last:
+            raise ValueError("the terms must be added in order, {} came after {}".format(term, self.last.decode('utf-8')))
+        self.last = encoded_term
+        self.blob += encoded_term
+        self.term_offsets.append(len(self.blob))
+        data = compression.encode_docids(self.codec, [posting[0] for posting in plist])
+        self.doc_data.write(data)
+        self.doc_size += len(data)
+        self.doc_start.append(self.doc_size)
+        scores = [posting[1] for posting in plist]
+        self.score_data.write(compression.Quantizer(0).encode(scores))
+        self.post_start.append(self.post_start[-1] + len(plist))
+        self.dfs.append(len(plist) if self.collection_dfs is None else self.collection_dfs[term])
+        self.max_scores.append(max(scores))
+        self.low = min(self.low, min(scores))
+        self.high = max(self.high, self.max_scores[-1])
+        # the last docid and the max score of every block
+        block_size = self.block_size
+        for start in range(0, len(plist), block_size):
+            self.block_lasts.append(plist[min(start + block_size, len(plist)) - 1][0])
+            self.block_maxes.append(max(scores[start:start + block_size]))
+        self.block_start.append(len(self.block_lasts))
+
+    def close(self):
+        """
+        quantize the scores and write the index file
+        :return: None
+        """
+        if self.stats and self.stats.get('score_range'):
+            # a shard is quantized like the whole collection
+            quantizer = compression.Quantizer.fit(self.quant_bits, self.stats['score_range'])
+        else:
+            quantizer = compression.Quantizer.fit(self.quant_bits, [self.low, self.high] if self.max_scores else [])
+        if self.quant_bits:
+            # the quantization keeps the order of the scores, so the upper bound of the scores the reader
+            # will decode is the decoded max
+            def bound(score):
+                return quantizer.decode(quantizer.encode([score]))[0]
+        else:
+            def bound(score):
+                return score
+        stats = self.stats
+        weights = self.weights
+        docids = self.docids
+        nterms = len(self.max_scores)
+        with open(self.path, 'wb') as f:
+            # reserve the header, it is written at last when every offset is known
+            f.write(b'\x00' * HEADER.size)
+            offsets = [
+                _write_array(f, 'I', docids),
+                _write_array(f, 'I', [stats['doclens'][docid] for docid in docids] if weights == 'tf' else []),
+                _write_array(f, 'Q', self.term_offsets),
+                _pad(f),
+            ]
+            f.write(bytes(self.blob))
+            offsets.append(_write_array(f, 'Q', self.post_start))
+            offsets.append(_write_array(f, 'Q', self.doc_start))
+            offsets.append(_write_array(f, 'Q', self.block_start))
+            offsets.append(_write_array(f, 'd', [bound(score) for score in self.max_scores]))
+            offsets.append(_write_array(f, 'I', self.dfs if weights == 'tf' else []))
+            offsets.append(_pad(f))
+            self.doc_data.seek(0)
+            shutil.copyfileobj(self.doc_data, f)
+            offsets.append(_pad(f))
+            self.score_data.seek(0)
+            if self.quant_bits:
+                exact = compression.Quantizer(0)
+                while True:
+                    data = self.score_data.read(self.CHUNK * 8)
+                    if not data:
+                        break
+                    f.write(quantizer.encode(exact.decode(data)))
+            else:
+                shutil.copyfileobj(self.score_data, f)
+            offsets.append(_write_array(f, 'I', self.block_lasts))
+            offsets.append(_write_array(f, 'd', [bound(score) for score in self.block_maxes]))
+            _pad(f)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.block_size,
+                                compression.CODECS.index(self.codec), self.quant_bits, WEIGHTS.index(weights),
+                                quantizer.low, quantizer.step, self.k, self.b,
+                                stats['average_doclen'] if stats else 0.0, stats['docs'] if stats else len(docids),
+                                len(docids), nterms, self.post_start[-1], len(self.block_lasts),
+                                *offsets))
+        self.doc_data.close()
+        self.score_data.close()
+
+
+class MappedTerms(object):
+    """Summary of MappedTerms here
+    the parts shared by the read only views of the mapped index files, the typed sections of the file
+    and the binary search of the sorted term dictionary
+    a subclass sets self.mm, the mapped file, self.nterms, self.term_offsets and self.term_blob, the offset
+    of the utf-8 bytes of the terms
+    """
+
+    def _section(self, typecode, offset, count):
+        """
+        get a typed view of a section of the mapped file
+        :param typecode: the array typecode of the section
+        :param offset: the offset of the section
+        :param count: the number of the items in the section
+        :return: a memoryview, or an array copy on a big endian host
+        """
+        size = array.array(typecode).itemsize
+        view = memoryview(self.mm)[offset:offset + count * size]
+        if sys.byteorder == 'little':
+            return view.cast(typecode)
+        data = array.array(typecode, view.tobytes())
+        data.byteswap()
+        return data
+
+    def term(self, i):
+        """
+        get the i-th term of the sorted term dictionary
+        :param i: the number of the term
+        :return: the term string
+        """
+        return self._term_bytes(i).decode('utf-8')
+
+    def _term_bytes(self, i):
+        """
+        get the utf-8 bytes of the i-th term
+        :param i: the number of the term
+        :return: the bytes of the term
+        """
+        return self.mm[self.term_blob + self.term_offsets[i]:self.term_blob + self.term_offsets[i + 1]]
+
+    def find(self, term):
+        """
+        binary search the term dictionary
+        :param term: the term to find
+        :return: the number of the term, -1 if it is not in the index
+        """
+        key = term.encode('utf-8')
+        lo, hi = 0, self.nterms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.nterms and self._term_bytes(lo) == key:
+            return lo
+        return -1
+
+
+class BinaryIndex(MappedTerms):
+    """Summary of BinaryIndex here
+    the read only view of a binary index file
+    the file is opened with mmap so the startup does not read the postings, and every process
+    opening the same file shares the pages of the OS page cache
+    postings, max_scores and blocks look like the dicts the BM25 class builds in memory,
+    so the query evaluators in retrieval work on both
+    cache_size is the number of the decoded posting lists kept for the hot terms
+    """
+
+    def __init__(self, path, cache_size=4096):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            raise IndexFormatError("{} is not a BM25 index".format(path))
+        fields = HEADER.unpack_from(self.mm, 0)
+        magic, version = fields[:2]
+        if magic != MAGIC:
+            raise IndexFormatError("{} is not a BM25 index".format(path))
+        if version != FORMAT_VERSION:
+            raise IndexFormatError("{} has the index format version {}, {} is expected".format(path, version, FORMAT_VERSION))
+        self.block_size, codec, quant_bits, weights, low, step = fields[2:8]
+        self.codec = compression.CODECS[codec]
+        self.quantizer = compression.Quantizer(quant_bits, low, step)
+        self.weights = WEIGHTS[weights]
+        # the k and b of the formula, the average document length and the number of the documents parsed
+        self.k, self.b, self.average_doclen, self.totaldocs = fields[8:12]
+        ndocs, nterms, npostings, nblocks = fields[12:16]
+        (doc_table, doc_lengths, term_offsets, term_blob, post_start, doc_start, block_start,
+         max_scores, term_dfs, self.doc_data, self.score_data, block_lasts, block_maxes) = fields[16:]
+
+        self.nterms = nterms
+        self.npostings = npostings
+        self.docids = self._section('I', doc_table, ndocs)
+        # the statistics are only in the index of the tf weights
+        stats = self.weights == 'tf'
+        self.doclens = self._section('I', doc_lengths, ndocs if stats else 0)
+        self.dfs = self._section('I', term_dfs, nterms if stats else 0)
+        self.term_offsets = self._section('Q', term_offsets, nterms + 1)
+        self.term_blob = term_blob
+        self.post_start = self._section('Q', post_start, nterms + 1)
+        self.doc_start = self._section('Q', doc_start, nterms + 1)
+        self.block_start = self._section('Q', block_start, nterms + 1)
+        self.term_max = self._section('d', max_scores, nterms)
+        self.block_lasts = self._section('I', block_lasts, nblocks)
+        self.block_maxes = self._section('d', block_maxes, nblocks)
+
+        # the decoded posting lists of the most recent terms are kept, the hot terms are not decoded every query
+        self.posting_list = functools.lru_cache(maxsize=cache_size)(self._decode_posting_list)
+        self.postings = _PostingsView(self)
+        self.max_scores = _MaxScoresView(self)
+        self.blocks = _BlocksView(self)
+
+    def _decode_posting_list(self, i):
+        """
+        decode the posting list of the i-th term, use self.posting_list to get it through the cache
+        :param i: the number of the term
+        :return: a list of (docid,score) sorted by docid
+        """
+        start, end = self.post_start[i], self.post_start[i + 1]
+        docids = compression.decode_docids(
+            self.codec, self.mm[self.doc_data + self.doc_start[i]:self.doc_data + self.doc_start[i + 1]], end - start)
+        size = self.quantizer.itemsize()
+        scores = self.quantizer.decode(self.mm[self.score_data + start * size:self.score_data + end * size])
+        return list(zip(docids, scores))
+
+    def close(self):
+        """
+        release the views and unmap the file
+        :return: None
+        """
+        self.posting_list.cache_clear()
+        for name in ('docids', 'doclens', 'dfs', 'term_offsets', 'post_start', 'doc_start', 'block_start', 'term_max',
+                     'block_lasts', 'block_maxes'):
+            view = getattr(self, name)
+            if isinstance(view, memoryview):
+                view.release()
+        self.mm.close()
+
+
+class _TermView(Mapping):
+    """Summary of _TermView here
+    the dict like view k:term over a BinaryIndex, the values are read from the mapped file on demand
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, term):
+        i = self.index.find(term)
+        if i < 0:
+            raise KeyError(term)
+        return self._value(i)
+
+    def __contains__(self, term):
+        return self.index.find(term) >= 0
+
+    def __iter__(self):
+        for i in range(self.index.nterms):
+            yield self.index.term(i)
+
+    def __len__(self):
+        return self.index.nterms
+
+    def _value(self, i):
+        raise NotImplementedError
+
+
+class _PostingsView(_TermView):
+    """the postings k:term v:list of (docid,score)"""
+
+    def _value(self, i):
+        return self.index.posting_list(i)
+
+
+class _MaxScoresView(_TermView):
+    """the upper bounds k:term v:the max score of the term"""
+
+    def _value(self, i):
+        return self.index.term_max[i]
+
+
+class _BlocksView(_TermView):
+    """the block upper bounds k:term v:[block last docids,block max scores]"""
+
+    def _value(self, i):
+        start, end = self.index.block_start[i], self.index.block_start[i + 1]
+        return [self.index.block_lasts[start:end], self.index.block_maxes[start:end]]
+
@@ -0,0 +1,175 @@
+import json
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Summary of LRUCache here
+    a dict bounded to maxsize entries, the least recently used entry is evicted first
+    it counts the hits, the misses and the evictions so the caller can report the hit rate
+    """
+
+    def __init__(self, maxsize=1024):
+        # the max number of the entries, 0 disables the cache
+        self.maxsize = maxsize
+        # the entries, the most recently used is at the end
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        get the value of a key and mark it as the most recently used
+        :param key: the key
+        :param default: the value returned on a miss
+        :return: the cached value or default
+        """
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        add an entry, evict the least recently used one when the cache is full
+        :param key: the key
+        :param value: the value
+        :return: None
+        """
+        if self.maxsize <= 0:
+            return
+        if key in self.data:
+            self.data.move_to_end(key)
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        drop every entry, the counters are kept
+        :return: None
+        """
+        self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def stats(self):
+        """
+        the counters of the cache
+        :return: a dict of the hits, misses, evictions, size and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.data), 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+class StemCache(object):
+    """Summary of StemCache here
+    memoize the stemmer for the indexing and the querying
+    the words seen while indexing go into the vocabulary map which is never evicted and can be
+    saved next to the index, the other query words go into a bounded LRU,
+    so the index and the queries share the same stems and every word is stemmed once
+    """
+
+    def __init__(self, stemmer, query_cache_size=4096):
+        # the stemmer with the stem(word) and stem_many(words) methods
+        self.stemmer = stemmer
+        # the full vocabulary map k:word v:stem
+        self.vocabulary = {}
+        # the bounded cache of the query words not in the vocabulary
+        self.queries = LRUCache(query_cache_size)
+        self.hits = 0
+        self.misses = 0
+
+    def stem(self, word, remember=False):
+        """
+        get the stem of a word
+        :param word: a lower case word
+        :param remember: True while indexing, the word is added to the vocabulary map
+        :return: the stem
+        """
+        stem = self.vocabulary.get(word)
+        if stem is not None:
+            self.hits += 1
+            return stem
+        if not remember:
+            stem = self.queries.get(word)
+            if stem is not None:
+                self.hits += 1
+                return stem
+        self.misses += 1
+        stem = self.stemmer.stem(word)
+        if remember:
+            self.vocabulary[word] = stem
+        else:
+            self.queries.put(word, stem)
+        return stem
+
+    def stem_many(self, words, remember=False):
+        """
+        get the stems of a batch of words, the words not in the cache are stemmed together
+        :param words: an iterable of the lower case words
+        :param remember: True while indexing, the new words are added to the vocabulary map
+        :return: the list of the stems in the same order
+        """
+        words = list(words)
+        vocabulary = self.vocabulary
+        stems = [vocabulary.get(word) for word in words]
+        missing = [word for word, stem in zip(words, stems) if stem is None]
+        if not missing:
+            self.hits += len(words)
+            return stems
+        if not remember:
+            # the query words may be in the LRU, only the rest goes to the stemmer
+            for i, stem in enumerate(stems):
+                if stem is None:
+                    stems[i] = self.queries.get(words[i])
+            missing = [word for word, stem in zip(words, stems) if stem is None]
+        # a word may repeat in the batch, stem it once
+        unique = list(dict.fromkeys(missing))
+        new = dict(zip(unique, self.stemmer.stem_many(unique)))
+        self.misses += len(unique)
+        self.hits += len(words) - len(unique)
+        if remember:
+            vocabulary.update(new)
+        else:
+            for word, stem in new.items():
+                self.queries.put(word, stem)
+        return [new[word] if stem is None else stem for word, stem in zip(words, stems)]
+
+    def save(self, path):
+        """
+        save the vocabulary map to the json file
+        :param path: the path of the file
+        :return: None
+        """
+        with open(path, 'w') as f:
+            json.dump(self.vocabulary, f)
+
+    def load(self, path):
+        """
+        load the vocabulary map from the json file
+        :param path: the path of the file
+        :return: None
+        """
+        with open(path) as f:
+            self.vocabulary = json.load(f)
+
+    def stats(self):
+        """
+        the counters of the cache
+        :return: a dict of the hits, misses, hit rate, vocabulary size and the query LRU counters
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'vocabulary': len(self.vocabulary), 'queries': self.queries.stats()}
@@ -0,0 +1,181 @@
+import array
+import sys
+from itertools import accumulate
+
+# the codecs of the docids of a posting list
+#   raw      the docids as 4 byte integers
+#   varint   the gaps between the docids as variable bytes, 7 bits a byte and the high bit set on all but the last
+#   bitpack  the gaps in chunks of BITPACK_CHUNK, every chunk packed with the bit width of its largest gap
+CODECS = ('raw', 'varint', 'bitpack')
+# the number of the gaps packed with the same bit width
+BITPACK_CHUNK = 128
+# the widths the scores can be quantized to, 0 keeps the exact 8 byte float
+QUANT_BITS = (0, 8, 16)
+
+
+def _gaps(docids):
+    """
+    turn the sorted docids into the gaps, the first gap is the first docid
+    :param docids: a list of the sorted docids
+    :return: a list of the gaps
+    """
+    prev = 0
+    gaps = []
+    for docid in docids:
+        gaps.append(docid - prev)
+        prev = docid
+    return gaps
+
+
+def encode_docids(codec, docids):
+    """
+    encode the sorted docids of a posting list
+    :param codec: one of CODECS
+    :param docids: a list of the sorted docids
+    :return: the encoded bytes
+    """
+    if codec == 'raw':
+        data = array.array('I', docids)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        return data.tobytes()
+    if codec == 'varint':
+        out = bytearray()
+        for gap in _gaps(docids):
+            while gap >= 0x80:
+                out.append((gap & 0x7f) | 0x80)
+                gap >>= 7
+            out.append(gap)
+        return bytes(out)
+    if codec == 'bitpack':
+        out = bytearray()
+        gaps = _gaps(docids)
+        for start in range(0, len(gaps), BITPACK_CHUNK):
+            chunk = gaps[start:start + BITPACK_CHUNK]
+            width = max(max(chunk).bit_length(), 1)
+            packed = 0
+            for i, gap in enumerate(chunk):
+                packed |= gap << (i * width)
+            out.append(width)
+            out += packed.to_bytes((len(chunk) * width + 7) // 8, 'little')
+        return bytes(out)
+    raise ValueError("unknown codec {}".format(codec))
+
+
+def decode_docids(codec, data, count):
+    """
+    decode the docids of a posting list
+    :param codec: one of CODECS
+    :param data: the encoded bytes (or a memoryview of them)
+    :param count: the number of the docids
+    :return: a list of the sorted docids
+    """
+    if codec == 'raw':
+        if sys.byteorder == 'little':
+            return memoryview(data).cast('I').tolist()
+        docids = array.array('I', bytes(data))
+        docids.byteswap()
+        return docids.tolist()
+    if codec == 'varint':
+        gaps = []
+        value = 0
+        shift = 0
+        for byte in bytes(data):
+            if byte < 0x80:
+                gaps.append(value | (byte << shift))
+                value = 0
+                shift = 0
+            else:
+                value |= (byte & 0x7f) << shift
+                shift += 7
+        return list(accumulate(gaps))
+    if codec == 'bitpack':
+        data = bytes(data)
+        gaps = []
+        pos = 0
+        while count > 0:
+            size = min(count, BITPACK_CHUNK)
+            width = data[pos]
+            nbytes = (size * width + 7) // 8
+            packed = int.from_bytes(data[pos + 1:pos + 1 + nbytes], 'little')
+            mask = (1 << width) - 1
+            gaps.extend([(packed >> shift) & mask for shift in range(0, size * width, width)])
+            pos += 1 + nbytes
+            count -= size
+        return list(accumulate(gaps))
+    raise ValueError("unknown codec {}".format(codec))
+
+
+class Quantizer(object):
+    """Summary of Quantizer here
+    map the scores linearly onto 2**bits levels between the smallest and the largest score,
+    with bits 0 the scores are kept as the exact 8 byte floats
+    """
+
+    def __init__(self, bits, low=0.0, step=1.0):
+        if bits not in QUANT_BITS:
+            raise ValueError("the scores can only be quantized to {} bits".format(QUANT_BITS))
+        self.bits = bits
+        # the score of the level 0
+        self.low = low
+        # the score between two levels
+        self.step = step
+        self.typecode = {0: 'd', 8: 'B', 16: 'H'}[bits]
+
+    @classmethod
+    def fit(cls, bits, scores):
+        """
+        make the quantizer which covers all the scores
+        :param bits: one of QUANT_BITS
+        :param scores: an iterable of every score of the index
+        :return: a Quantizer
+        """
+        if bits == 0:
+            return cls(bits)
+        low = float('inf')
+        high = float('-inf')
+        for score in scores:
+            low = min(low, score)
+            high = max(high, score)
+        if high <= low:
+            return cls(bits, low if low != float('inf') else 0.0, 1.0)
+        return cls(bits, low, (high - low) / ((1 << bits) - 1))
+
+    def encode(self, scores):
+        """
+        encode the scores of a posting list
+        :param scores: a list of the scores
+        :return: the encoded bytes
+        """
+        if self.bits == 0:
+            data = array.array('d', scores)
+        else:
+            data = array.array(self.typecode, [int(round((score - self.low) / self.step)) for score in scores])
+        if sys.byteorder != 'little':
+            data.byteswap()
+        return data.tobytes()
+
+    def decode(self, data):
+        """
+        decode the scores of a posting list
+        :param data: the encoded bytes (or a memoryview of them)
+        :return: a list of the scores
+        """
+        if sys.byteorder == 'little':
+            levels = memoryview(data).cast(self.typecode).tolist()
+        else:
+            levels = array.array(self.typecode, bytes(data))
+            levels.byteswap()
+            levels = levels.tolist()
+        if self.bits == 0:
+            return levels
+        low = self.low
+        step = self.step
+        return [low + level * step for level in levels]
+
+    def itemsize(self):
+        """
+        the bytes of an encoded score
+        :return: the size in bytes
+        """
+        return array.array(self.typecode).itemsize
@@ -0,0 +1,54 @@
+import math
+
+
+def query_metrics(relevant, ranking, n=10, r=0.4, legacy=False, depth=None):
+    """
+    the metrics of a query in one pass over its ranking, the relevance is a set so a rank is checked in O(1)
+        precision          the relevant returned documents over the returned documents
+        recall             the relevant returned documents over the relevant documents
+        precision_at_n     the relevant documents in the first n ranks over n
+        r_precision        the precision at the first rank where the recall passes r, None if it never does
+        average_precision  the sum of the precisions at the relevant ranks over the relevant documents
+        ndcg               the binary gain discounted by log2(rank+1), over the gain of the ideal ranking
+                           cut at the same depth, a short ranking is not ideal because it is short
+    the legacy definitions are the ones the evaluation printed before, precision_at_n counts the relevant
+    documents of the whole ranking and average_precision is over the returned documents
+    :param relevant: the set of the relevant docids
+    :param ranking: the list of the returned docids, the best first
+    :param n: the n of the precision at n
+    :param r: the recall the R precision is taken at
+    :param legacy: True for the legacy precision at n and average precision
+    :param depth: the number of the results asked for, the ranking was cut there, None if it was not cut
+    :return: a dict of the metrics
+    """
+    rel = len(relevant)
+    hits = 0
+    # the relevant documents in the first n ranks
+    hits_at_n = 0
+    precision_sum = 0.0
+    dcg = 0.0
+    r_precision = None
+    for rank, docid in enumerate(ranking, 1):
+        if docid in relevant:
+            hits += 1
+            precision_sum += hits / rank
+            dcg += 1 / math.log2(rank + 1)
+            if rank <= n:
+                hits_at_n += 1
+        if r_precision is None and rel and hits / rel > r:
+            r_precision = hits / rank
+    ret = len(ranking)
+    ideal = sum(1 / math.log2(rank + 1) for rank in range(1, (rel if depth is None else min(rel, depth)) + 1))
+    if legacy:
+        precision_at_n = hits / n
+        average_precision = precision_sum / ret if ret else 0.0
+    else:
+        precision_at_n = hits_at_n / n
+        average_precision = precision_sum / rel if rel else 0.0
+    return {'precision': hits / ret if ret else 0.0,
+            'recall': hits / rel if rel else 0.0,
+            'precision_at_n': precision_at_n,
+            'r_precision': r_precision,
+            'average_precision': average_precision,
+            'ndcg': dcg / ideal if ideal else 0.0}
+
@@ -28,6 +28,9 @@
 #
 ###
 
+import re
+
+
 class PorterStemmer:
 
     def __init__(self):
@@ -338,4 +341,176 @@ class PorterStemmer:
         self.step3()
         self.step4()
         self.step5()
-        return self.b[self.k0:self.k+1]
\ No newline at end of file
+        return self.b[self.k0:self.k+1]
+
+# the stateless, table driven version of the algorithm above
+# ----------------------------------------------------------
+#
+# PorterStemmer keeps the word in self.b, self.k and self.j while it stems, so one instance can not
+# be shared between threads. Stemmer below keeps everything in local variables: a word is held as
+# the string of its current stem, and the consonant/vowel form of the word is computed with
+# str.translate instead of calling cons() for every letter. The steps 2, 3 and 4 are driven by the
+# suffix tables keyed by the same letter PorterStemmer switches on. It gives exactly the same stems
+# as PorterStemmer, including the --DEPARTURE-- rules, tests/test_porter.py checks it on the LISA words.
+
+# every ascii letter to c for a consonant or v for a vowel, the y is resolved by its previous letter
+_FORM = {i: 'c' for i in range(128)}
+_FORM.update(str.maketrans('aeiouy', 'vvvvvy'))
+# the letters of a non ascii word which are not a vowel and not a y
+_NOT_VOWEL = re.compile(r'[^aeiouy]')
+
+# step2: k:the letter before the last v:the (suffix, replacement) tried in order
+_STEP2 = {
+    'a': (('ational', 'ate'), ('tional', 'tion')),
+    'c': (('enci', 'ence'), ('anci', 'ance')),
+    'e': (('izer', 'ize'),),
+    'l': (('bli', 'ble'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous')),
+    'o': (('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate')),
+    's': (('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous')),
+    't': (('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble')),
+    'g': (('logi', 'log'),),
+}
+
+# step3: k:the last letter v:the (suffix, replacement) tried in order
+_STEP3 = {
+    'e': (('icate', 'ic'), ('ative', ''), ('alize', 'al')),
+    'i': (('iciti', 'ic'),),
+    'l': (('ical', 'ic'), ('ful', '')),
+    's': (('ness', ''),),
+}
+
+# step4: k:the letter before the last v:the suffixes tried in order
+_STEP4 = {
+    'a': ('al',),
+    'c': ('ance', 'ence'),
+    'e': ('er',),
+    'i': ('ic',),
+    'l': ('able', 'ible'),
+    'n': ('ant', 'ement', 'ment', 'ent'),
+    'o': ('ion', 'ou'),
+    's': ('ism',),
+    't': ('ate', 'iti'),
+    'u': ('ous',),
+    'v': ('ive',),
+    'z': ('ize',),
+}
+
+
+def _form(w):
+    """_form(w) is the string of c for a consonant and v for a vowel of every letter of w."""
+    if w.isascii():
+        form = w.translate(_FORM)
+    else:
+        form = _NOT_VOWEL.sub('c', w).translate(_FORM)
+    if 'y' not in form:
+        return form
+    letters = list(form)
+    for i, ch in enumerate(letters):
+        if ch == 'y':
+            # y is a consonant at the start or after a vowel
+            letters[i] = 'c' if i == 0 or letters[i - 1] == 'v' else 'v'
+    return ''.join(letters)
+
+
+def _m(form, j):
+    """_m(form, j) measures the number of consonant sequences in the letters 0..j, like m()."""
+    return form[:j + 1].count('vc')
+
+
+def _cvc(w, form, i):
+    """_cvc(w, form, i) is TRUE <=> i-2,i-1,i has the form consonant - vowel - consonant and w[i] is not w, x or y."""
+    return i >= 2 and form[i - 2:i + 1] == 'cvc' and w[i] not in 'wxy'
+
+
+def _doublec(w, form, j):
+    """_doublec(w, form, j) is TRUE <=> j,(j-1) contain a double consonant."""
+    return j >= 1 and w[j] == w[j - 1] and form[j] == 'c'
+
+
+class Stemmer(object):
+    """Summary of Stemmer here
+    the stateless Porter stemmer, one instance can be shared by every thread
+    stem(word) gives the same stem as PorterStemmer().stem(word),
+    stem_many(words) stems a batch of words
+    """
+
+    def stem(self, w):
+        """stem(w) returns the stem of the lower case word w."""
+        if len(w) <= 2:
+            return w  # --DEPARTURE--, as in PorterStemmer
+
+        # step1ab gets rid of plurals and -ed or -ing
+        if w[-1] == 's':
+            if w.endswith('sses'):
+                w = w[:-2]
+            elif w.endswith('ies'):
+                w = w[:-2]
+            elif w[-2] != 's':
+                w = w[:-1]
+        if w.endswith('eed'):
+            if _m(_form(w), len(w) - 4) > 0:
+                w = w[:-1]
+        else:
+            for suffix in ('ed', 'ing'):
+                if w.endswith(suffix):
+                    rest = w[:-len(suffix)]
+                    if 'v' in _form(rest):
+                        w = rest
+                        if w.endswith('at') or w.endswith('bl') or w.endswith('iz'):
+                            w = w + 'e'
+                        else:
+                            form = _form(w)
+                            k = len(w) - 1
+                            if _doublec(w, form, k):
+                                if w[-1] not in 'lsz':
+                                    w = w[:-1]
+                            elif _m(form, k) == 1 and _cvc(w, form, k):
+                                w = w + 'e'
+                    break
+
+        # step1c turns terminal y to i when there is another vowel in the stem
+        if w[-1] == 'y' and 'v' in _form(w[:-1]):
+            w = w[:-1] + 'i'
+
+        # step2 maps double suffices to single ones
+        for suffix, replacement in _STEP2.get(w[-2:-1], ()):
+            if w.endswith(suffix):
+                stem = w[:-len(suffix)]
+                if _m(_form(stem), len(stem) - 1) > 0:
+                    w = stem + replacement
+                break
+
+        # step3 deals with -ic-, -full, -ness etc.
+        for suffix, replacement in _STEP3.get(w[-1], ()):
+            if w.endswith(suffix):
+                stem = w[:-len(suffix)]
+                if _m(_form(stem), len(stem) - 1) > 0:
+                    w = stem + replacement
+                break
+
+        # step4 takes off -ant, -ence etc., in context <c>vcvc<v>
+        for suffix in _STEP4.get(w[-2:-1], ()):
+            if w.endswith(suffix):
+                stem = w[:-len(suffix)]
+                if suffix == 'ion' and stem[-1:] not in ('s', 't'):
+                    continue
+                if _m(_form(stem), len(stem) - 1) > 1:
+                    w = stem
+                break
+
+        # step5 removes a final -e and changes -ll to -l if m() > 1
+        form = _form(w)
+        k = len(w) - 1
+        if w[-1] == 'e':
+            a = _m(form, k)
+            if a > 1 or (a == 1 and not _cvc(w, form, k - 1)):
+                w = w[:-1]
+        if w[-1] == 'l' and _doublec(w, form, len(w) - 1) and _m(form, k) > 1:
+            w = w[:-1]
+        return w
+
+    def stem_many(self, words):
+        """stem_many(words) returns the list of the stems of the words, in the same order."""
+        stem = self.stem
+        return [stem(w) for w in words]
+
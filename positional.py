@@ -0,0 +1,270 @@
+import array
+import functools
+import heapq
+import mmap
+import os
+import struct
+
+import binindex
+import compression
+import retrieval
+
+# the first bytes of every positional index file
+MAGIC = b'BM25POS\x00'
+# the version of the layout below, bumped on every incompatible change
+FORMAT_VERSION = 1
+
+# the header: magic, version, the counts of the terms and the postings, then the offset of every section
+#   the sections: term offsets, term blob, term postings start, term docid bytes start, term position bytes start,
+#                 posting position bytes start (from the start of the term), posting docids, posting positions
+# the docids of a term are the gaps as varints, the positions of a posting are the gaps as varints too
+HEADER = struct.Struct('<8sI4x2Q8Q')
+
+
+def phrase_span(positions):
+    """
+    check the terms follow each other, the rarest term leads and the others gallop to the position it asks for
+    :param positions: the sorted positions in the document of every term of the phrase, in the phrase order
+    :return: the span of the phrase, len(positions)-1, or None if the document doesn't have the phrase
+    """
+    lead = min(range(len(positions)), key=lambda i: len(positions[i]))
+    cursors = [0] * len(positions)
+    for start in positions[lead]:
+        start -= lead
+        if start < 0:
+            continue
+        for i, plist in enumerate(positions):
+            if i == lead:
+                continue
+            cursors[i] = retrieval.gallop(plist, start + i, cursors[i])
+            if cursors[i] == len(plist):
+                return None
+            if plist[cursors[i]] != start + i:
+                break
+        else:
+            return len(positions) - 1
+    return None
+
+
+def window_span(positions):
+    """
+    the smallest window which holds an occurrence of every term in any order
+    :param positions: the sorted positions in the document of every term
+    :return: the span of the window, its last position minus its first one
+    """
+    heap = [(plist[0], i, 0) for i, plist in enumerate(positions)]
+    heapq.heapify(heap)
+    high = max(plist[0] for plist in positions)
+    best = high - heap[0][0]
+    while True:
+        low, i, j = heapq.heappop(heap)
+        best = min(best, high - low)
+        if j + 1 == len(positions[i]):
+            return best
+        position = positions[i][j + 1]
+        high = max(high, position)
+        heapq.heappush(heap, (position, i, j + 1))
+
+
+def closeness(terms, span):
+    """
+    how close the terms of a matched clause are, 1 for the exact phrase and less for a looser window
+    :param terms: the terms of the clause
+    :param span: the span of the terms in the document
+    :return: a number in (0,1]
+    """
+    return 1.0 if span == 0 else (len(terms) - 1) / span
+
+
+class PositionalWriter(object):
+    """Summary of PositionalWriter here
+    write a positional index file from the position lists given one term at a time,
+    the terms must come in the order of their utf-8 bytes like in binindex.IndexWriter
+        with PositionalWriter(path) as writer:
+            writer.add(term, docids, positions)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last = None
+        self.term_offsets = [0]
+        self.blob = bytearray()
+        self.post_start = [0]
+        self.doc_start = [0]
+        self.pos_start = [0]
+        self.posting_start = array.array('I')
+        self.doc_data = bytearray()
+        self.pos_data = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False
+
+    def add(self, term, docids, positions):
+        """
+        add the positions of a term
+        :param term: the term, after the terms already added in the order of the utf-8 bytes
+        :param docids: the sorted docids of the documents with the term
+        :param positions: the sorted positions of the term in every document, in the order of the docids
+        :return: None
+        """
+        encoded_term = term.encode('utf-8')
+        if self.last is not None and encoded_term <= self.last:
+            raise ValueError("the terms must be added in order, {} came after {}".format(term, self.last.decode('utf-8')))
+        self.last = encoded_term
+        self.blob += encoded_term
+        self.term_offsets.append(len(self.blob))
+        self.doc_data += compression.encode_docids('varint', docids)
+        self.doc_start.append(len(self.doc_data))
+        start = len(self.pos_data)
+        for plist in positions:
+            self.posting_start.append(len(self.pos_data) - start)
+            self.pos_data += compression.encode_docids('varint', plist)
+        self.pos_start.append(len(self.pos_data))
+        self.post_start.append(self.post_start[-1] + len(docids))
+
+    def close(self):
+        """
+        write the positional index file
+        :return: None
+        """
+        with open(self.path, 'wb') as f:
+            f.write(b'\x00' * HEADER.size)
+            offsets = [binindex._write_array(f, 'Q', self.term_offsets), binindex._pad(f)]
+            f.write(bytes(self.blob))
+            offsets.append(binindex._write_array(f, 'Q', self.post_start))
+            offsets.append(binindex._write_array(f, 'Q', self.doc_start))
+            offsets.append(binindex._write_array(f, 'Q', self.pos_start))
+            offsets.append(binindex._write_array(f, 'I', self.posting_start))
+            offsets.append(binindex._pad(f))
+            f.write(bytes(self.doc_data))
+            offsets.append(binindex._pad(f))
+            f.write(bytes(self.pos_data))
+            binindex._pad(f)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(self.post_start) - 1, self.post_start[-1], *offsets))
+
+
+class PositionalIndex(binindex.MappedTerms):
+    """Summary of PositionalIndex here
+    the read only view of a positional index file, mapped like binindex.BinaryIndex
+    it finds the documents of the phrase and proximity clauses of a query:
+    the docids of the clause terms are intersected first, and only the positions of the documents
+    which have every term are decoded and matched
+    the positions are the places of the terms in the analyzed text of a document, the stopwords are
+    not counted, so "library of congress" is the phrase librari congress
+    """
+
+    def __init__(self, path, cache_size=4096):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            raise binindex.IndexFormatError("{} is not a positional index".format(path))
+        fields = HEADER.unpack_from(self.mm, 0)
+        magic, version = fields[:2]
+        if magic != MAGIC:
+            raise binindex.IndexFormatError("{} is not a positional index".format(path))
+        if version != FORMAT_VERSION:
+            raise binindex.IndexFormatError("{} has the positional format version {}, {} is expected".format(path, version, FORMAT_VERSION))
+        self.nterms, self.npostings = fields[2:4]
+        term_offsets, self.term_blob, post_start, doc_start, pos_start, posting_start, self.doc_data, self.pos_data = fields[4:]
+        self.term_offsets = self._section('Q', term_offsets, self.nterms + 1)
+        self.post_start = self._section('Q', post_start, self.nterms + 1)
+        self.doc_start = self._section('Q', doc_start, self.nterms + 1)
+        self.pos_start = self._section('Q', pos_start, self.nterms + 1)
+        self.posting_start = self._section('I', posting_start, self.npostings)
+        # the decoded docids of the most recent terms
+        self.docids = functools.lru_cache(maxsize=cache_size)(self._decode_docids)
+
+    def _decode_docids(self, i):
+        """
+        decode the docids of the i-th term, use self.docids to get them through the cache
+        :param i: the number of the term
+        :return: a list of the sorted docids
+        """
+        return compression.decode_docids('varint', self.mm[self.doc_data + self.doc_start[i]:self.doc_data + self.doc_start[i + 1]],
+                                         self.post_start[i + 1] - self.post_start[i])
+
+    def positions(self, i, j):
+        """
+        decode the positions of the j-th posting of the i-th term
+        :param i: the number of the term
+        :param j: the number of the posting in the posting list of the term
+        :return: a list of the sorted positions
+        """
+        base = self.pos_data + self.pos_start[i]
+        posting = self.post_start[i] + j
+        start = base + self.posting_start[posting]
+        end = base + self.posting_start[posting + 1] if j + 1 < self.post_start[i + 1] - self.post_start[i] \
+            else self.pos_data + self.pos_start[i + 1]
+        return compression.decode_docids('varint', self.mm[start:end], 0)
+
+    def match(self, clauses):
+        """
+        find the documents which match every clause
+        :param clauses: a list of (terms, window), terms is the tuple of the analyzed terms of the clause,
+                        window is None for the exact phrase, or N when the terms must be in any order
+                        with at most N other terms between them
+        :return: a dict k:docid v:the sum of the closeness of the clauses, in the docid order
+        """
+        terms = list(dict.fromkeys(term for clause_terms, window in clauses for term in clause_terms))
+        numbers = [self.find(term) for term in terms]
+        if min(numbers, default=-1) < 0:
+            return {}
+        slot = {term: s for s, term in enumerate(terms)}
+        matches = {}
+        for docid, cursors in retrieval.intersect([self.docids(i) for i in numbers], docids=True, cursors=True):
+            positions = {}
+            total = 0.0
+            for clause_terms, window in clauses:
+                lists = []
+                for term in clause_terms:
+                    s = slot[term]
+                    if s not in positions:
+                        positions[s] = self.positions(numbers[s], cursors[s])
+                    lists.append(positions[s])
+                if window is None:
+                    span = phrase_span(lists)
+                    if span is None:
+                        break
+                else:
+                    span = window_span(lists)
+                    if span - (len(lists) - 1) > window:
+                        break
+                total += closeness(clause_terms, span)
+            else:
+                matches[docid] = total
+        return matches
+
+    def close(self):
+        """
+        release the views and unmap the file
+        :return: None
+        """
+        self.docids.cache_clear()
+        for name in ('term_offsets', 'post_start', 'doc_start', 'pos_start', 'posting_start'):
+            view = getattr(self, name)
+            if isinstance(view, memoryview):
+                view.release()
+        self.mm.close()
+
+
+def usable(path):
+    """
+    check the positional index file can be read by this version of the program
+    :param path: the path of the file
+    :return: True if the file exists and has the current format
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        PositionalIndex(path).close()
+    except binindex.IndexFormatError as error:
+        print("{}, it will be generated again".format(error))
+        return False
+    return True
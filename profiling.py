@@ -0,0 +1,92 @@
+import time
+from contextlib import nullcontext
+
+# the context of a stage when the profiler is off, it is shared so a disabled stage allocates nothing
+_OFF = nullcontext()
+
+
+class Profiler(object):
+    """Summary of Profiler here
+    record the wall time and the number of the calls of the named stages of the indexing and the querying
+        with PROFILER.stage('query.stemming'):
+            ...
+    a stage can run inside another one, every stage records its inclusive time
+    when the profiler is off a stage only costs the check of self.enabled
+    """
+
+    def __init__(self):
+        # True to record the stages
+        self.enabled = False
+        # the stages in the order they first ran k:name v:[calls,seconds]
+        self.stages = {}
+
+    def stage(self, name):
+        """
+        the context which times a stage
+        :param name: the name of the stage, the part before the dot is the pipeline
+        :return: a context manager
+        """
+        if not self.enabled:
+            return _OFF
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        """
+        add a call of a stage
+        :param name: the name of the stage
+        :param seconds: the wall time of the call
+        :return: None
+        """
+        stage = self.stages.get(name)
+        if stage is None:
+            self.stages[name] = [1, seconds]
+        else:
+            stage[0] += 1
+            stage[1] += seconds
+
+    def reset(self):
+        """
+        forget the recorded stages
+        :return: None
+        """
+        self.stages = {}
+
+    def summary(self):
+        """
+        the structured summary of the stages
+        :return: a dict k:name v:{calls,seconds,mean_ms}
+        """
+        return {name: {'calls': calls, 'seconds': seconds, 'mean_ms': seconds / calls * 1000}
+                for name, (calls, seconds) in self.stages.items()}
+
+    def report(self):
+        """
+        the summary of the stages as a table
+        :return: the text of the table
+        """
+        lines = ["{0:<24}{1:>10}{2:>12}{3:>12}".format('stage', 'calls', 'total s', 'mean ms')]
+        for name, stage in self.summary().items():
+            lines.append("{0:<24}{1:>10}{2:>12.4f}{3:>12.4f}".format(name, stage['calls'], stage['seconds'], stage['mean_ms']))
+        return '\n'.join(lines)
+
+
+class _Stage(object):
+    """the context of a stage while the profiler is on"""
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# the profiler of the process, the --profile option turns it on
+PROFILER = Profiler()
@@ -0,0 +1,467 @@
+import bisect
+import heapq
+
+import profiling
+
+
+class TopK(list):
+    """Summary of TopK here
+    the ranked result of a query, a list of (docid,score) sorted by the score
+    it behaves like the plain sorted list so it can be sliced and iterated as before,
+    and it also records the k that was asked and if fewer than k documents matched,
+    so the caller never gets zero score documents as padding
+    """
+
+    def __init__(self, results, k=None):
+        list.__init__(self, results)
+        # the number of the results asked, None means all the matches
+        self.k = k
+        # True when the query matched fewer documents than k
+        self.fewer_than_k = k is not None and len(self) < k
+
+
+def rank_key(item):
+    """
+    the key to order a (docid,score) pair, higher score first and the smaller docid wins the tie
+    :param item: a (docid,score) pair
+    :return: a key which is larger for the better ranked pair
+    """
+    return item[1], -item[0]
+
+
+def top_k(scores, k=None):
+    """
+    select the best k documents from the accumulators with a bounded heap
+    the heap never holds more than k entries, so the whole score list is never sorted
+    :param scores: a dict k:docid v:score of the matched documents
+    :param k: the number of the results, None to rank all the matches
+    :return: a TopK list of (docid,score)
+    """
+    with profiling.PROFILER.stage('query.top_k'):
+        if k is None:
+            return TopK(sorted(scores.items(), key=rank_key, reverse=True))
+        if k <= 0:
+            return TopK([], k)
+        return TopK(heapq.nlargest(k, scores.items(), key=rank_key), k)
+
+
+# the slack used when a score upper bound is compared with the threshold,
+# the bound and the real score are summed in a different order so they can differ in the last bit
+EPSILON = 1e-9
+
+
+def taat(postings, terms, k=None):
+    """
+    the exhaustive term at a time evaluation, accumulate every posting of the query terms
+    :param postings: the inverted index k:term v:list of (docid,score) sorted by docid
+    :param terms: the list of the unique query terms
+    :param k: the number of the results, None to rank all the matches
+    :return: a TopK list of (docid,score)
+    """
+    scores = {}
+    for term in terms:
+        for docid, score in postings.get(term, ()):
+            scores[docid] = scores.get(docid, 0) + score
+    return top_k(scores, k)
+
+
+def score_documents(postings, terms, docids):
+    """
+    score only the given documents, a cursor moves forward over the posting list of every term
+    the scores are summed in the order of the terms like taat, so a document gets the same score
+    :param postings: the inverted index k:term v:list of (docid,score) sorted by docid
+    :param terms: the list of the unique query terms
+    :param docids: the sorted docids of the documents to score
+    :return: a dict k:docid v:score
+    """
+    scores = dict.fromkeys(docids, 0)
+    for term in terms:
+        plist = postings.get(term, ())
+        pos = 0
+        for docid in scores:
+            pos = bisect.bisect_left(plist, (docid,), pos)
+            if pos == len(plist):
+                break
+            if plist[pos][0] == docid:
+                scores[docid] += plist[pos][1]
+    return scores
+
+
+def gallop(values, target, lo=0):
+    """
+    the exponential search of a sorted list, the steps double from lo before the binary search,
+    so a cursor which moves forward only pays for the distance it moves
+    :param values: a sorted list, a posting list of (docid,score) or a list of the docids or the positions
+    :param target: the value to find, (docid,) in a posting list
+    :param lo: the index to start from
+    :return: the index of the first value not less than the target, len(values) if there is none
+    """
+    n = len(values)
+    step = 1
+    hi = lo
+    while hi < n and values[hi] < target:
+        lo = hi + 1
+        hi += step
+        step <<= 1
+    return bisect.bisect_left(values, target, lo, min(hi, n))
+
+
+def intersect(lists, docids=False, cursors=False):
+    """
+    the docids in every list, the shortest list leads and the others gallop to its docids,
+    so the cost follows the rarest term and not the size of the collection
+    :param lists: the posting lists, lists of (docid,score) sorted by docid
+    :param docids: True when the lists are the sorted docids and not the posting lists
+    :param cursors: True to get the index of every docid in every list too
+    :return: the sorted list of the docids, or of (docid, the tuple of its index in every list) with cursors
+    """
+    if not lists:
+        return []
+    order = sorted(range(len(lists)), key=lambda i: len(lists[i]))
+    lead = order[0]
+    positions = [0] * len(lists)
+    result = []
+    for j, value in enumerate(lists[lead]):
+        docid = value if docids else value[0]
+        target = docid if docids else (docid,)
+        positions[lead] = j
+        for i in order[1:]:
+            values = lists[i]
+            positions[i] = gallop(values, target, positions[i])
+            if positions[i] == len(values):
+                return result
+            found = values[positions[i]]
+            if (found if docids else found[0]) != docid:
+                break
+        else:
+            result.append((docid, tuple(positions)) if cursors else docid)
+    return result
+
+
+def conjunctive(postings, terms, required, k=None):
+    """
+    the AND evaluation, only the documents with every required term are ranked, by the score of all the query terms
+    :param postings: the inverted index k:term v:list of (docid,score) sorted by docid
+    :param terms: the list of the unique query terms
+    :param required: the terms every result must have
+    :param k: the number of the results, None to rank all the matches
+    :return: a TopK list of (docid,score)
+    """
+    with profiling.PROFILER.stage('query.intersect'):
+        docids = intersect([postings.get(term, ()) for term in required])
+    return top_k(score_documents(postings, terms, docids), k)
+
+
+def wand(postings, max_scores, terms, k):
+    """
+    the document at a time WAND evaluation
+    every term has a cursor on its posting list, the cursors are sorted by their current docid
+    and the upper bounds are summed until they pass the score of the k-th document in the heap,
+    the documents before that pivot can never enter the top k so the cursors skip them
+    with a binary search instead of scoring them
+    :param postings: the inverted index k:term v:list of (docid,score) sorted by docid
+    :param max_scores: the upper bound k:term v:the max score of the term in any document
+    :param terms: the list of the unique query terms
+    :param k: the number of the results
+    :return: a TopK list of (docid,score), the same as taat(postings,terms,k)
+    """
+    if k is None:
+        # there is nothing to prune without a k
+        return taat(postings, terms, k)
+    if k <= 0:
+        return TopK([], k)
+
+    # the cursor is a list [current docid, position, posting list, upper bound, query order]
+    cursors = []
+    for order, term in enumerate(terms):
+        plist = postings.get(term)
+        if plist:
+            # a negative max score still bounds the contribution by 0
+            cursors.append([plist[0][0], 0, plist, max(max_scores[term], 0), order])
+
+    # the min heap of (score,-docid), its root is the k-th best document
+    heap = []
+    threshold = float('-inf')
+
+    while cursors:
+        cursors.sort(key=lambda cursor: cursor[0])
+
+        # find the pivot, the first cursor where the summed upper bound can beat the threshold
+        bound = 0
+        pivot = -1
+        for i, cursor in enumerate(cursors):
+            bound += cursor[3]
+            if bound + EPSILON > threshold:
+                pivot = i
+                break
+        if pivot < 0:
+            # even all the terms together can not enter the top k
+            break
+        pivot_doc = cursors[pivot][0]
+
+        if cursors[0][0] == pivot_doc:
+            # every cursor before the pivot is on the pivot document, score it fully
+            # and sum in the query order so the score is bit identical with taat
+            matched = [cursor for cursor in cursors if cursor[0] == pivot_doc]
+            matched.sort(key=lambda cursor: cursor[4])
+            score = 0
+            for cursor in matched:
+                score += cursor[2][cursor[1]][1]
+            entry = (score, -pivot_doc)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            if len(heap) == k:
+                threshold = heap[0][0]
+            # move the cursors to the next posting
+            for cursor in matched:
+                cursor[1] += 1
+        else:
+            # the documents before the pivot document can not enter the top k, skip them
+            for cursor in cursors[:pivot]:
+                if cursor[0] < pivot_doc:
+                    cursor[1] = bisect.bisect_left(cursor[2], (pivot_doc,), cursor[1] + 1)
+
+        # update the current docid and drop the exhausted cursors
+        alive = []
+        for cursor in cursors:
+            if cursor[1] < len(cursor[2]):
+                cursor[0] = cursor[2][cursor[1]][0]
+                alive.append(cursor)
+        cursors = alive
+
+    results = sorted(((-docid, score) for score, docid in heap), key=rank_key, reverse=True)
+    return TopK(results, k)
+
+
+def maxscore(postings, max_scores, terms, k):
+    """
+    the document at a time MaxScore evaluation
+    the cursors are sorted by the upper bound, the terms whose summed upper bounds can not pass
+    the threshold are non essential: a document only in their posting lists can never enter the top k,
+    so the candidates come from the essential lists and the non essential lists are only probed
+    with a binary search while the document can still pass the threshold
+    :param postings: the inverted index k:term v:list of (docid,score) sorted by docid
+    :param max_scores: the upper bound k:term v:the max score of the term in any document
+    :param terms: the list of the unique query terms
+    :param k: the number of the results
+    :return: a TopK list of (docid,score), the same as taat(postings,terms,k)
+    """
+    if k is None:
+        return taat(postings, terms, k)
+    if k <= 0:
+        return TopK([], k)
+
+    # the docid of an exhausted cursor
+    end = float('inf')
+    # the cursor is a list [current docid, position, posting list, upper bound, query order]
+    cursors = []
+    for order, term in enumerate(terms):
+        plist = postings.get(term)
+        if plist:
+            cursors.append([plist[0][0], 0, plist, max(max_scores[term], 0), order])
+    cursors.sort(key=lambda cursor: cursor[3])
+
+    # prefix[i] is the summed upper bound of the cursors[0..i]
+    prefix = []
+    bound = 0
+    for cursor in cursors:
+        bound += cursor[3]
+        prefix.append(bound)
+
+    heap = []
+    threshold = float('-inf')
+    # cursors[first:] are the essential ones
+    first = 0
+    while first < len(cursors):
+        essential = cursors[first:]
+        doc = min(cursor[0] for cursor in essential)
+        if doc == end:
+            break
+
+        # score the essential cursors on the candidate and move them forward
+        matched = []
+        for cursor in essential:
+            if cursor[0] == doc:
+                matched.append((cursor[4], cursor[2][cursor[1]][1]))
+                cursor[1] += 1
+                cursor[0] = cursor[2][cursor[1]][0] if cursor[1] < len(cursor[2]) else end
+        score = 0
+        for order, value in matched:
+            score += value
+
+        # probe the non essential cursors from the largest upper bound while the candidate can pass
+        i = first - 1
+        while i >= 0 and score + prefix[i] + EPSILON > threshold:
+            cursor = cursors[i]
+            plist = cursor[2]
+            pos = bisect.bisect_left(plist, (doc,), cursor[1])
+            cursor[1] = pos
+            if pos < len(plist) and plist[pos][0] == doc:
+                matched.append((cursor[4], plist[pos][1]))
+                score += plist[pos][1]
+            i -= 1
+        if i >= 0:
+            # stopped early, the candidate can not enter the top k
+            continue
+
+        # sum in the query order so the score is bit identical with taat
+        matched.sort()
+        score = 0
+        for order, value in matched:
+            score += value
+        entry = (score, -doc)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+        else:
+            continue
+        if len(heap) == k:
+            # the threshold rose, more terms may become non essential
+            threshold = heap[0][0]
+            while first < len(cursors) and prefix[first] + EPSILON <= threshold:
+                first += 1
+
+    results = sorted(((-docid, score) for score, docid in heap), key=rank_key, reverse=True)
+    return TopK(results, k)
+
+
+def block_max_wand(postings, max_scores, blocks, block_size, terms, k):
+    """
+    the Block-Max WAND evaluation
+    the pivot is found with the global upper bounds like wand, then the block max scores of the
+    cursors on the pivot document are summed; if even that can not pass the threshold the whole
+    blocks are skipped up to the nearest block end instead of scoring the pivot document
+    :param postings: the inverted index k:term v:list of (docid,score) sorted by docid
+    :param max_scores: the upper bound k:term v:the max score of the term in any document
+    :param blocks: the block upper bounds k:term v:[list of the last docid of every block, list of the block max score]
+    :param block_size: the number of the postings in every block
+    :param terms: the list of the unique query terms
+    :param k: the number of the results
+    :return: a TopK list of (docid,score), the same as taat(postings,terms,k)
+    """
+    if k is None:
+        return taat(postings, terms, k)
+    if k <= 0:
+        return TopK([], k)
+
+    # the cursor is a list [current docid, position, posting list, upper bound, query order, block lasts, block maxes]
+    cursors = []
+    for order, term in enumerate(terms):
+        plist = postings.get(term)
+        if plist:
+            lasts, maxes = blocks[term]
+            cursors.append([plist[0][0], 0, plist, max(max_scores[term], 0), order, lasts, maxes])
+
+    heap = []
+    threshold = float('-inf')
+
+    while cursors:
+        cursors.sort(key=lambda cursor: cursor[0])
+
+        # find the pivot with the global upper bounds
+        bound = 0
+        pivot = -1
+        for i, cursor in enumerate(cursors):
+            bound += cursor[3]
+            if bound + EPSILON > threshold:
+                pivot = i
+                break
+        if pivot < 0:
+            break
+        pivot_doc = cursors[pivot][0]
+        # the cursors after the pivot on the same document belong to it too
+        while pivot + 1 < len(cursors) and cursors[pivot + 1][0] == pivot_doc:
+            pivot += 1
+
+        # sum the max score of the block every cursor would hold the pivot document in
+        block_bound = 0
+        next_doc = float('inf')
+        for cursor in cursors[:pivot + 1]:
+            lasts = cursor[5]
+            block = bisect.bisect_left(lasts, pivot_doc, cursor[1] // block_size)
+            if block < len(lasts):
+                block_bound += max(cursor[6][block], 0)
+                next_doc = min(next_doc, lasts[block] + 1)
+
+        if block_bound + EPSILON > threshold:
+            if cursors[0][0] == pivot_doc:
+                # score the pivot document fully in the query order
+                matched = cursors[:pivot + 1]
+                matched.sort(key=lambda cursor: cursor[4])
+                score = 0
+                for cursor in matched:
+                    score += cursor[2][cursor[1]][1]
+                entry = (score, -pivot_doc)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+                if len(heap) == k:
+                    threshold = heap[0][0]
+                for cursor in matched:
+                    cursor[1] += 1
+            else:
+                # skip the documents before the pivot document like wand
+                for cursor in cursors[:pivot]:
+                    if cursor[0] < pivot_doc:
+                        cursor[1] = bisect.bisect_left(cursor[2], (pivot_doc,), cursor[1] + 1)
+        else:
+            # no document up to the nearest block end can pass the threshold, skip the whole blocks
+            if pivot + 1 < len(cursors):
+                next_doc = min(next_doc, cursors[pivot + 1][0])
+            for cursor in cursors[:pivot + 1]:
+                if cursor[0] < next_doc:
+                    cursor[1] = bisect.bisect_left(cursor[2], (next_doc,), cursor[1] + 1)
+
+        alive = []
+        for cursor in cursors:
+            if cursor[1] < len(cursor[2]):
+                cursor[0] = cursor[2][cursor[1]][0]
+                alive.append(cursor)
+        cursors = alive
+
+    results = sorted(((-docid, score) for score, docid in heap), key=rank_key, reverse=True)
+    return TopK(results, k)
+
+
+def evaluate(evaluator, postings, max_scores, blocks, block_size, terms, k, required=()):
+    """
+    score the query terms with the named evaluator, or with the AND evaluation when some terms are required
+    :param evaluator: 'taat', 'wand', 'maxscore' or 'bmw'
+    :param postings: the inverted index k:term v:list of (docid,score) sorted by docid
+    :param max_scores: the upper bound k:term v:the max score of the term in any document
+    :param blocks: the block upper bounds k:term v:[block last docids,block max scores]
+    :param block_size: the number of the postings in a block
+    :param terms: the list of the unique query terms
+    :param k: the number of the results, None to rank all the matches
+    :param required: the terms every result must have, empty for the OR of the terms
+    :return: a TopK list of (docid,score)
+    """
+    if required:
+        # the intersection is small and exact, the evaluators only prune the OR
+        return conjunctive(postings, terms, required, k)
+    if evaluator == 'wand':
+        return wand(postings, max_scores, terms, k)
+    if evaluator == 'bmw':
+        return block_max_wand(postings, max_scores, blocks, block_size, terms, k)
+    if evaluator == 'maxscore':
+        return maxscore(postings, max_scores, terms, k)
+    # term at a time over the posting lists, the best k is kept in a bounded heap
+    return taat(postings, terms, k)
+
+
+def merge_top_k(results, k=None):
+    """
+    merge the top k of the shards which hold disjoint documents into the top k of the collection
+    :param results: the TopK lists of the shards
+    :param k: the number of the results, None to rank all the matches
+    :return: a TopK list of (docid,score)
+    """
+    with profiling.PROFILER.stage('query.merge'):
+        merged = [item for result in results for item in result]
+        if k is None:
+            return TopK(sorted(merged, key=rank_key, reverse=True))
+        return TopK(heapq.nlargest(k, merged, key=rank_key), k)
@@ -0,0 +1,98 @@
+import hashlib
+import json
+
+# the start of the tags of the runs made by this program
+TAG_PREFIX = 'bm25-'
+
+
+def run_tag(params):
+    """
+    the tag of a run, it names the index and the parameters which produced the run
+    :param params: a dict of the things the results depend on, it must be JSON serializable
+    :return: the tag, bm25- and the first 16 hex digits of the hash of the params
+    """
+    return TAG_PREFIX + hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class Run(object):
+    """Summary of Run here
+    the ranked results of a set of queries, kept in memory so the evaluation scores them without a file
+    it can be exported to and read from the TREC run format, one line a result:
+        queryid Q0 docid rank score tag
+    the tag of the run names the index and the parameters which produced it, so a run read from
+    a file is only reused when its tag is the one the current index and parameters would give
+    """
+
+    def __init__(self, tag, depth=None):
+        # the tag, see run_tag
+        self.tag = tag
+        # the number of the results asked for every query, None if it is not known
+        self.depth = depth
+        # the results k:queryid v:list of (docid,score) the best first
+        self.results = {}
+
+    def add(self, queryid, ranking):
+        """
+        add the results of a query
+        :param queryid: the id of the query
+        :param ranking: a list of (docid,score) the best first
+        :return: None
+        """
+        self.results[queryid] = list(ranking)
+
+    def rankings(self):
+        """
+        the ranked docids of every query
+        :return: a dict k:queryid v:list of the docids the best first
+        """
+        return {queryid: [docid for docid, score in ranking] for queryid, ranking in self.results.items()}
+
+    def __len__(self):
+        return len(self.results)
+
+    def save(self, path):
+        """
+        write the run to a TREC run file at once
+        :param path: the path of the file
+        :return: None
+        """
+        lines = ["{} Q0 {} {} {!r} {}\n".format(queryid, docid, rank, float(score), self.tag)
+                 for queryid, ranking in self.results.items()
+                 for rank, (docid, score) in enumerate(ranking, 1)]
+        with open(path, 'w') as f:
+            f.writelines(lines)
+
+    @classmethod
+    def load(cls, path):
+        """
+        read a TREC run file
+        :param path: the path of the file
+        :return: the Run, its tag is the one of the first line, None if the file is empty or not a TREC run
+                 with the number ids of this program
+        """
+        run = None
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                if len(fields) != 6:
+                    return None
+                if run is None:
+                    run = cls(fields[5])
+                try:
+                    queryid = int(fields[0])
+                    posting = (int(fields[2]), float(fields[4]))
+                except ValueError:
+                    return None
+                if queryid not in run.results:
+                    run.results[queryid] = []
+                run.results[queryid].append(posting)
+        return run
+
+    def made_here(self):
+        """
+        check the run was made by this program, only such a run file is overwritten
+        :return: True if the tag is one of run_tag
+        """
+        return isinstance(self.tag, str) and self.tag.startswith(TAG_PREFIX)
@@ -0,0 +1,121 @@
+import functools
+import math
+from collections.abc import Mapping
+
+
+class QueryTimeBM25(object):
+    """Summary of QueryTimeBM25 here
+    compute the BM25 weights when the query runs from an index of the raw statistics
+    (the term frequencies, the document lengths, the document frequencies and the average length),
+    so k and b can be changed without building the index again
+    the idf of every term and the length norm of every document are cached, and so are the
+    weighted posting lists of the hot terms, so a warm query costs the same as with the precomputed weights
+    postings, max_scores and blocks look like the ones of the BM25 class, the evaluators in retrieval work on them
+    """
+
+    def __init__(self, index, k=1, b=0.75, cache_size=4096):
+        # the binindex.BinaryIndex of the tf weights
+        self.index = index
+        # the k of the formula
+        self.k = k
+        # the b of the formula
+        self.b = b
+        # the number of the postings in a block, it was set when the index was built
+        self.block_size = index.block_size
+        # the number of the documents parsed and their average length
+        self.totaldocs = index.totaldocs
+        self.average_doclen = index.average_doclen
+        # the length norm of every document k:docid v:k * ((1-b) + b * doclen / average_doclen)
+        self.norms = {}
+        for docid, doclen in zip(index.docids, index.doclens):
+            self.norms[docid] = k * ((1 - b) + b * doclen / self.average_doclen)
+        # the idf of the terms already queried k:term v:idf
+        self.idfs = {}
+        # the weighted posting lists, their max score and blocks of the most recent terms
+        self.weighted = functools.lru_cache(maxsize=cache_size)(self._weigh)
+
+        self.postings = _PostingsView(self)
+        self.max_scores = _MaxScoresView(self)
+        self.blocks = _BlocksView(self)
+
+    def idf(self, i):
+        """
+        the idf of the i-th term of the index
+        :param i: the number of the term
+        :return: the idf
+        """
+        idf = self.idfs.get(i)
+        if idf is None:
+            df = self.index.dfs[i]
+            idf = math.log((self.totaldocs - df + 0.5) / (df + 0.5), 2)
+            self.idfs[i] = idf
+        return idf
+
+    def _weigh(self, i):
+        """
+        compute the BM25 weights of the posting list of the i-th term, in the same order of the
+        operations as BM25.calculate_bm25 so the weights are the same to the last bit
+        use self.weighted to get them through the cache
+        :param i: the number of the term
+        :return: (the list of (docid,weight), the max weight, the block last docids, the block max weights)
+        """
+        k = self.k
+        norms = self.norms
+        idf = self.idf(i)
+        plist = [(docid, freq * (1 + k) / (freq + norms[docid]) * idf)
+                 for docid, freq in self.index.posting_list(i)]
+        lasts = []
+        maxes = []
+        for start in range(0, len(plist), self.block_size):
+            block = plist[start:start + self.block_size]
+            lasts.append(block[-1][0])
+            maxes.append(max(posting[1] for posting in block))
+        return plist, max(maxes), lasts, maxes
+
+
+class _TermView(Mapping):
+    """Summary of _TermView here
+    the dict like view k:term over a QueryTimeBM25, the values are computed on demand
+    """
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+
+    def __getitem__(self, term):
+        i = self.scorer.index.find(term)
+        if i < 0:
+            raise KeyError(term)
+        return self._value(self.scorer.weighted(i))
+
+    def __contains__(self, term):
+        return self.scorer.index.find(term) >= 0
+
+    def __iter__(self):
+        return iter(self.scorer.index.postings)
+
+    def __len__(self):
+        return self.scorer.index.nterms
+
+    def _value(self, weighted):
+        raise NotImplementedError
+
+
+class _PostingsView(_TermView):
+    """the postings k:term v:list of (docid,weight)"""
+
+    def _value(self, weighted):
+        return weighted[0]
+
+
+class _MaxScoresView(_TermView):
+    """the upper bounds k:term v:the max weight of the term"""
+
+    def _value(self, weighted):
+        return weighted[1]
+
+
+class _BlocksView(_TermView):
+    """the block upper bounds k:term v:[block last docids,block max weights]"""
+
+    def _value(self, weighted):
+        return [weighted[2], weighted[3]]
@@ -1,55 +1,197 @@
-import json
-import re
 import math
 import porter
+import analysis
+import retrieval
+import binindex
+import compression
+import cache
+import scoring
+import sparse
+import server
+import profiling
+import spimi
+import sharding
+import positional
+import metrics
+import runs
+import array
+import bisect
 import os
 import getopt
 import sys
+import multiprocessing
+import gzip
+import concurrent.futures
+from collections import deque
 
 
 class BM25(object):
     """Summary of BM 25 here
     this Class is to handle the BM25 Model , process the file and apply the content for search
-    process the lisa.all.txt and store in the BM25Weights.json
+    process the lisa.all.txt and store it in the binary index file
     the main process is :
     parse the lisa.all.txt into the dict like this (k:docid,v:content)
-    parse the content in the content with re module and porter module
+    parse the content in the content with the analyzer which splits, stems and filters the words
     for every words in content calculate the tf and the idf that is the base step for the BM25 Model
     when get the tf and the idf using the formula to calculate the BM25 weights and store it in the file
     """
 
-    def __init__(self,all_path,stopwords_path):
+    # the file name of the binary index of every kind of the weights, so building one never replaces the other
+    index_files = {'bm25':'BM25Index.bin','tf':'BM25Index.tf.bin'}
+
+    def __init__(self,all_path,stopwords_path,block_size=None,codec=None,quant_bits=None,workers=1,
+                 weights='bm25',k=1,b=0.75,memory_budget=0,shards=1,positions=False):
 
         # specific path for file to parse
         self.all = all_path
-        # the file name of the BMWeights
-        self.bm25_file = 'BM25Weights.json'
-        # the porter to stem the words
-        self.porter = porter.PorterStemmer()
+        # the porter to stem the words, it is stateless so it can be shared
+        self.porter = porter.Stemmer()
+        # the memoized porter shared by the indexing and the querying
+        self.stem_cache = cache.StemCache(self.porter)
+        # the file name of the stems of the vocabulary, saved next to the index
+        self.stems_file = 'BM25Stems.json'
         # the stopwords which is read from the stopwords_path
         self.stopwords = self._read_stopwords(stopwords_path)
+        # the analyzer which turns the documents and the queries into the terms
+        self.analyzer = analysis.Analyzer(self.stem_cache,self.stopwords)
         # the doc k:docid v:{k:len,v:doclen,k:tfs,v:tfs} tfs is a dict with k:term v: a number of the frequency
         self.docdict = {}
         # the idfs k:term v: a number of the over all frequency
         self.idfs = {}
         # the BM25 value dict k:docid v:{k:term,v:score}
         self.BM25 = {}
+        # the file name of the binary inverted index
+        self.index_file = self.index_files[weights]
+        # the mapped binary index, None until it is loaded
+        self.index = None
+        # the codec of the docids in the binary index, one of compression.CODECS, raw for a new index when it is not given
+        self.codec = 'raw' if codec is None else codec
+        # the bits of a quantized score in the binary index, 0 keeps the exact score and is the one of a new index
+        self.quant_bits = 0 if quant_bits is None else quant_bits
+        # the inverted index k:term v:a list of (docid,score) sorted by the docid
+        self.postings = {}
+        # the upper bound of every term k:term v:the max score in its posting list
+        self.max_scores = {}
+        # the build options given, None for the ones not given, an index on the disk built with others is built again
+        self.asked = {'block_size':block_size,'codec':codec,'quant_bits':quant_bits}
+        # the number of the postings in a block of the posting list, 64 for a new index when it is not given
+        self.block_size = 64 if block_size is None else block_size
+        # the block upper bounds k:term v:[list of the last docid of every block,list of the block max score]
+        self.blocks = {}
+        # the number of the processes to parse the documents when the index is built
+        self.workers = workers
         # the k of the formula
-        self.k = 1
+        self.k = k
         # the b of the formula
-        self.b = 0.75
-
-        # judge that if here is the BM25Weightfile:
-        if os.path.exists(self.bm25_file):
-            #load the BM25Weights
+        self.b = b
+        # what the index stores, 'bm25' for the weights computed with k and b,
+        # 'tf' for the raw statistics so k and b are applied when the query runs
+        self.weights = weights
+        # the number of the documents parsed and their average length
+        self.totaldocsize = 0
+        self.average_doclen = 0
+        # the query time scorer of the tf weights, None for the bm25 weights
+        self.scorer = None
+        # the bytes of the postings held in memory by the out of core build, 0 builds the index in memory
+        self.memory_budget = memory_budget
+        # the number of the shards, with more than 1 the collection is cut into the shard index files
+        self.shards = shards
+        self.shard_files = sharding.shard_files(self.index_file,shards) if shards > 1 else []
+        # the file name of the positional index and the mapped index, None when the positions are not asked for
+        self.positions_file = 'BM25Positions.bin'
+        self.positions = None
+
+        # True when the index is generated now, the positions are generated again with it
+        built = False
+        if self.shards > 1:
+            # the shards are loaded by the processes which serve them, only the stems are loaded here
+            if all(os.path.exists(path) and self._index_usable(path) for path in self.shard_files):
+                print("Using the {} BM25 shards on file. \n".format(self.shards))
+            else:
+                print("Generateing {} BM25 shards....".format(self.shards))
+                built = True
+                self._calculate_postings()
+                with profiling.PROFILER.stage('index.save'):
+                    self.save_shards()
+            if os.path.exists(self.stems_file):
+                self.stem_cache.load(self.stems_file)
+        # judge that if here is the binary index:
+        elif os.path.exists(self.index_file) and self._index_usable():
+            #load the binary index
             print("Loading BM25 index from file, please wait. \n")
-            self.load_bm25()
+            with profiling.PROFILER.stage('index.load'):
+                self.load_index()
         else:
             # calcualte the bm25 score and store
             print("BM25 index is not exists")
             print("Generateing BM25 index....")
-            self.calculate_bm25()
-            self.save_bm25()
+            built = True
+            if self.memory_budget:
+                # the postings are merged from the runs on the disk straight into the index file
+                with profiling.PROFILER.stage('index.spimi'):
+                    self.build_spimi()
+            else:
+                self._calculate_postings()
+                with profiling.PROFILER.stage('index.save'):
+                    self.save_index()
+            with profiling.PROFILER.stage('index.load'):
+                self.load_index()
+
+        if positions:
+            if built or not positional.usable(self.positions_file):
+                print("Generateing the positional index....")
+                with profiling.PROFILER.stage('index.positions'):
+                    self.build_positions()
+            self.positions = positional.PositionalIndex(self.positions_file)
+
+    def _calculate_postings(self):
+        """
+        parse the collection and build the postings in memory
+        :return: None
+        """
+        if self.weights == 'tf':
+            # only the statistics are stored, the weights are computed by the query
+            with profiling.PROFILER.stage('index.calculate_statistics'):
+                self.calculate_statistics()
+            with profiling.PROFILER.stage('index.build_postings'):
+                self.build_tf_postings()
+        else:
+            with profiling.PROFILER.stage('index.calculate_bm25'):
+                self.calculate_bm25()
+            with profiling.PROFILER.stage('index.build_postings'):
+                self.build_postings()
+
+    def _index_usable(self,path=None):
+        """
+        check the index file can be read by this version of the program and has the weights asked for
+        :param path: the path of the index file, self.index_file by default
+        :return: True if the index file has the current format, the same weights and the build options given
+        """
+        path = path or self.index_file
+        try:
+            index = binindex.BinaryIndex(path)
+        except binindex.IndexFormatError as error:
+            print("{}, it will be generated again".format(error))
+            return False
+        usable = True
+        if index.weights != self.weights:
+            print("{} has the {} weights, it will be generated again with the {} weights".format(path,index.weights,self.weights))
+            usable = False
+        elif index.weights == 'bm25' and (index.k != self.k or index.b != self.b):
+            # the precomputed weights can't be changed, the raw statistics (tf weights) can
+            print("{} was computed with k={} b={}, it will be generated again with k={} b={}".format(path,index.k,index.b,self.k,self.b))
+            usable = False
+        elif self.asked['block_size'] is not None and index.block_size != self.asked['block_size']:
+            print("{} has the blocks of {} postings, it will be generated again with {}".format(path,index.block_size,self.asked['block_size']))
+            usable = False
+        elif self.asked['codec'] is not None and index.codec != self.asked['codec']:
+            print("{} has the {} codec, it will be generated again with the {} codec".format(path,index.codec,self.asked['codec']))
+            usable = False
+        elif self.asked['quant_bits'] is not None and index.quantizer.bits != self.asked['quant_bits']:
+            print("{} has the scores of {} bits, it will be generated again with {} bits".format(path,index.quantizer.bits,self.asked['quant_bits']))
+            usable = False
+        index.close()
+        return usable
 
     def _read_stopwords(self,stopwords_path):
         """
@@ -65,30 +207,50 @@ class BM25(object):
 
     def _read_file(self):
         """
-        read the doc info from the self.all file
-        and split it into the list everydoc
-        :return: a list of the doc info
+        read the doc info from the self.all file one document at a time
+        the file is read line by line through the buffered file object, so only the current
+        document is held in memory whatever the size of the corpus
+        a gzip compressed file is read the same way
+        :return: a generator of the doc info
         """
-        # open the file to get the content of all files
-        with open(self.all) as f:
-            file_all = f.read()
-            # a spacific file is look list this
-
-            # Document    2
-            # THE LINGERING FRAGRANCE: PROCEEDINGS OF THE XXIV ALL INDIA LIBRARY CONFERENCE,
-            # BANGALORE.
-            #
-            # PAPERS AND PROCEEDINGS FROM THE CONFERENCE, WITH A SUMMARY BY N.D. BAGARI, AND
-            # TRANSCRIPTS OF THE INAUGURAL SPEECH, INTRODUCTORY PAPERS, AND MAIN
-            # PRESENTATIONS. THE CONFERENCE WAS HELD FROM 29 JAN TO 1 FEB 78.
-            # ********************************************
-
-            # split the all file with the ********************************************
-            everydoc = file_all.split('********************************************\n')
+        # a spacific file is look list this
+
+        # Document    2
+        # THE LINGERING FRAGRANCE: PROCEEDINGS OF THE XXIV ALL INDIA LIBRARY CONFERENCE,
+        # BANGALORE.
+        #
+        # PAPERS AND PROCEEDINGS FROM THE CONFERENCE, WITH A SUMMARY BY N.D. BAGARI, AND
+        # TRANSCRIPTS OF THE INAUGURAL SPEECH, INTRODUCTORY PAPERS, AND MAIN
+        # PRESENTATIONS. THE CONFERENCE WAS HELD FROM 29 JAN TO 1 FEB 78.
+        # ********************************************
+
+        # the documents end with the line ********************************************
+        separator = '********************************************\n'
+        with self._open_corpus() as f:
+            lines = []
+            for line in f:
+                if line.endswith(separator):
+                    # the text before the separator on the same line belongs to the document
+                    lines.append(line[:-len(separator)])
+                    yield ''.join(lines)
+                    lines = []
+                else:
+                    lines.append(line)
+            # the text after the last separator
+            tail = ''.join(lines)
+            if tail != "":
+                yield tail
 
-            if everydoc[-1] == "":
-                everydoc.pop()
-        return everydoc
+    def _open_corpus(self):
+        """
+        open the self.all file as text, it is decompressed if it starts with the gzip magic number
+        :return: the file object
+        """
+        with open(self.all,'rb') as f:
+            magic = f.read(2)
+        if magic == b'\x1f\x8b':
+            return gzip.open(self.all,'rt')
+        return open(self.all)
 
     def _process_file(self):
         """
@@ -96,13 +258,67 @@ class BM25(object):
         :return: a int of the all document terms length , a int of the document length
         """
         alldoclen = 0
+        totaldocsize = 0
         everydoc = self._read_file()
+        if self.workers > 1:
+            return self._process_file_parallel(everydoc)
         # to extract the docid and preprocess
         for doc in everydoc:
             doclen = self._prase_doc(doc)
             alldoclen += doclen
+            totaldocsize += 1
 
-        return alldoclen,len(everydoc)
+        return alldoclen,totaldocsize
+
+    def _process_file_parallel(self,everydoc):
+        """
+        parse the documents with a pool of self.workers processes
+        the documents are cut into contiguous shards as they are read, every worker returns the docdict,
+        the idfs and the stems of its shard, and they are merged in the shard order so the result is
+        the same as the serial process, byte for byte
+        only a few shards a worker are in flight, so the corpus is never held in memory at once
+        :param everydoc: an iterable of the doc info
+        :return: a int of the all document terms length , a int of the document length
+        """
+        # the number of the documents in a shard
+        size = 256
+        alldoclen = 0
+        totaldocsize = 0
+        pending = deque()
+        with multiprocessing.Pool(self.workers) as pool:
+            shard = []
+            for doc in everydoc:
+                shard.append(doc)
+                totaldocsize += 1
+                if len(shard) == size:
+                    pending.append(pool.apply_async(_parse_shard,((self.stopwords,shard),)))
+                    shard = []
+                    # wait for the oldest shard when every worker has two queued
+                    if len(pending) >= self.workers * 2:
+                        alldoclen += self._merge_shard(*pending.popleft().get())
+            if shard:
+                pending.append(pool.apply_async(_parse_shard,((self.stopwords,shard),)))
+            while pending:
+                alldoclen += self._merge_shard(*pending.popleft().get())
+        return alldoclen,totaldocsize
+
+    def _merge_shard(self,docdict,idfs,vocabulary,doclen):
+        """
+        merge the result of a shard into the docdict, the idfs and the stem cache
+        :param docdict: the docdict of the shard
+        :param idfs: the idfs of the shard
+        :param vocabulary: the stems of the words of the shard, in the order they were first seen
+        :param doclen: the all terms length of the shard
+        :return: the all terms length of the shard
+        """
+        self.docdict.update(docdict)
+        for term,df in idfs.items():
+            self.idfs[term] = self.idfs.get(term,0) + df
+        # the new words are added in the order they were first seen, as in the serial process
+        for word,stem in vocabulary.items():
+            if word not in self.stem_cache.vocabulary:
+                self.stem_cache.vocabulary[word] = stem
+        return doclen
 
     def _prase_doc(self,doc):
         """
@@ -110,84 +326,80 @@ class BM25(object):
         :param doc: a specific document
         :return: a int of the document length
         """
-        doc = doc.split('\n')
-
-        # get the id
-        docid = int(doc[0].split('Document')[1])
-        # get the content and change to lower
-        doccontent = ''.join(doc[1:]).lower()
-        # preprocess the content
-        doccontent = self._content_preprocess(doccontent)
-        # steming the content
-        doclen,tfs = self._content_stemming(doccontent)
+        docid,doclen,tfs = self._doc_terms(doc)
         # add it the self.docdict k:docid ,v :{k:'len',v:doclen,k:'tfs',v:tfs}
         self.docdict[docid] = {'len':doclen,'tfs':tfs}
         return doclen
 
-        #print("doclen: {}".format(doclen))
-        # print(doccontent)
-
-    def _content_preprocess(self,doccontent):
+    def _doc_terms(self,doc):
         """
-        Strategy: for every doccontent remove the all the punctuation
-        like : . , ' ? ! () $ % ^ * " / - :
-        remove the multi blank blocks from the content
-        :param doccontent:
-        :return: the parsed content of the document
+        prase a specific document into its doc id, its length and its tfs
+        :param doc: a specific document
+        :return: the docid, a int of the document length, the tfs k:term v:frequency
         """
-        # remove the specific punctuation to space
-        doccontent = re.sub(r"[.(),?$%^*:\"\'/-]|[+——！，。？、~@#￥%……&*（）]"," ",doccontent)
-        # remove the continuous space
-        doccontent = re.sub(r"\s+"," ",doccontent)
-        # split the content to list
-        doccontent = filter(None,doccontent.split(" "))
+        docid,terms = self._doc_analyze(doc)
+        # count the terms to get the tfs
+        doclen,tfs = self._count_terms(terms)
+        return docid,doclen,tfs
 
-        # if doccontent[-1] == '':
-        #     doccontent.pop()
+    def _doc_analyze(self,doc):
+        """
+        prase a specific document into its doc id and its terms
+        :param doc: a specific document
+        :return: the docid, the list of the terms in the order of the text
+        """
+        doc = doc.split('\n')
 
-        return doccontent
+        # get the id
+        docid = int(doc[0].split('Document')[1])
+        # get the terms of the content
+        with profiling.PROFILER.stage('index.analyze'):
+            terms = self.analyzer.analyze(''.join(doc[1:]),True,'index')
+        return docid,terms
 
-    def _content_stemming(self,doccontent):
+    def _count_terms(self,terms):
         """
-        stemming the content to get the tfs
-        :param doccontent: a specific doc list of to stem
+        count the terms of a document to get the tfs
+        :param terms: the list of the terms of a document
         :return: the doclen and the its tfs
         """
-        doclen = 0
         tfs = {}
-        # visit every term of the content list
-        for everyterm in doccontent:
-            # stem it
-            everyterm = self.porter.stem(everyterm)
-
-            # parse if it is not the stop words
-            if everyterm not in self.stopwords:
-                # add the length
-                doclen +=1
-                # set the tfs
-                # if it already in the tfs add the count else set it to 1
-                if everyterm in tfs:
-                    tfs[everyterm] +=1
-                else:
-                    if everyterm in self.idfs:
-                        self.idfs[everyterm] +=1
-                    else :
-                        self.idfs[everyterm] =1
-                    tfs[everyterm] = 1
-
-        return doclen,tfs
-
-    def calculate_bm25(self):
+        # visit every term of the document
+        for everyterm in terms:
+            # set the tfs
+            # if it already in the tfs add the count else set it to 1
+            if everyterm in tfs:
+                tfs[everyterm] +=1
+            else:
+                if everyterm in self.idfs:
+                    self.idfs[everyterm] +=1
+                else :
+                    self.idfs[everyterm] =1
+                tfs[everyterm] = 1
+
+        return len(terms),tfs
+
+    def calculate_statistics(self):
         """
-        the main function to calculate the bm25 vlaue
+        process the file to get the tfs and the length of every document, the idfs,
+        the number of the documents and their average length
         :return: None
         """
-
         # get the all terms length and the munber of the doc
         alldoclen,totaldocsize = self._process_file()
+        self.totaldocsize = totaldocsize
 
         # calculate the average doc terms length
-        average_doclen = alldoclen / totaldocsize
+        self.average_doclen = alldoclen / totaldocsize
+
+    def calculate_bm25(self):
+        """
+        the main function to calculate the bm25 vlaue
+        :return: None
+        """
+        self.calculate_statistics()
+        totaldocsize = self.totaldocsize
+        average_doclen = self.average_doclen
 
         # get every doc in the docdict
         for docid,doc in self.docdict.items():
@@ -210,28 +422,267 @@ class BM25(object):
             # add to BM25 dict with its docid
             self.BM25[docid] = value
         # print(self.BM25)
-    def save_bm25(self):
+    def build_spimi(self):
+        """
+        build the index file out of core with the single pass in memory indexing,
+        the documents are read one at a time and their postings go to the spimi.SpimiBuilder, which flushes
+        a sorted run to the disk every self.memory_budget bytes, then the runs are merged term by term,
+        the weights are computed from the merged tfs and written straight to the binary index
+        only the document lengths, the document frequencies and a block of the postings are held in memory,
+        the index is the same byte for byte as the one built in memory
+        :return: None
         """
-        save the self.BM25 model to the json file
+        directory = os.path.dirname(os.path.abspath(self.index_file))
+        doclens = {}
+        alldoclen = 0
+        totaldocsize = 0
+        with spimi.SpimiBuilder(self.memory_budget,directory) as builder:
+            for doc in self._read_file():
+                docid,doclen,tfs = self._doc_terms(doc)
+                doclens[docid] = doclen
+                alldoclen += doclen
+                totaldocsize += 1
+                builder.add(docid,tfs)
+            self.totaldocsize = totaldocsize
+            self.average_doclen = alldoclen / totaldocsize
+            stats = {'docs':totaldocsize,'average_doclen':self.average_doclen,'doclens':doclens}
+            k = self.k
+            b = self.b
+            average_doclen = self.average_doclen
+            with binindex.IndexWriter(self.index_file,doclens,self.block_size,self.codec,self.quant_bits,
+                                      self.weights,k,b,stats) as writer:
+                for term,docids,tfs in builder.merge():
+                    if self.weights == 'tf':
+                        writer.add(term,list(zip(docids,tfs)))
+                        continue
+                    # the same operations in the same order as calculate_bm25, so the weights are the same
+                    df = len(docids)
+                    idf = math.log((totaldocsize - df +0.5)/(df+0.5), 2)
+                    writer.add(term,[(docid,freq * (1 + k) / (freq + k * ((1-b)+b * doclens[docid]/average_doclen)) * idf)
+                                     for docid,freq in zip(docids,tfs)])
+        # the stems of the vocabulary are saved next to the index for the queries
+        if self.stem_cache.vocabulary:
+            self.stem_cache.save(self.stems_file)
+
+    def build_positions(self):
+        """
+        parse the collection again and write the positions of every term in every document to the positional index
+        the positions are the places in the analyzed terms of the document, the ones the phrases of the queries get
+        with a memory budget the position lists are spilled to the runs on the disk like the postings of build_spimi
         :return: None
         """
-        with open(self.bm25_file,'w') as f:
-            json.dump(self.BM25,f)
+        if self.memory_budget:
+            self._build_positions_spimi()
+            return
+        # k:term v:[list of the docids,list of the position lists]
+        postings = {}
+        for doc in self._read_file():
+            docid,positions = self._doc_positions(doc)
+            for term,plist in positions.items():
+                if term in postings:
+                    postings[term][0].append(docid)
+                    postings[term][1].append(plist)
+                else:
+                    postings[term] = [[docid],[plist]]
+        with positional.PositionalWriter(self.positions_file) as writer:
+            for term in sorted(postings,key=lambda term: term.encode('utf-8')):
+                docids,plists = postings[term]
+                # the collection may not be in the docid order
+                order = sorted(range(len(docids)),key=docids.__getitem__)
+                writer.add(term,[docids[i] for i in order],[plists[i] for i in order])
+
+    def _build_positions_spimi(self):
+        """
+        write the positional index out of core like build_spimi, the position lists go to a spimi.PositionsBuilder
+        which flushes a sorted run every self.memory_budget bytes, then the runs are merged term by term
+        into the positional index, the file is the same byte for byte as the one built in memory
+        :return: None
+        """
+        directory = os.path.dirname(os.path.abspath(self.positions_file))
+        with spimi.PositionsBuilder(self.memory_budget,directory) as builder:
+            for doc in self._read_file():
+                builder.add(*self._doc_positions(doc))
+            with positional.PositionalWriter(self.positions_file) as writer:
+                for term,docids,plists in builder.merge():
+                    writer.add(term,docids,plists)
+
+    def _doc_positions(self,doc):
+        """
+        prase a specific document into its doc id and the positions of its terms
+        :param doc: a specific document
+        :return: the docid, the positions k:term v:the array of the positions of the term in the analyzed text
+        """
+        docid,terms = self._doc_analyze(doc)
+        positions = {}
+        for position,term in enumerate(terms):
+            if term in positions:
+                positions[term].append(position)
+            else:
+                positions[term] = array.array('I',[position])
+        return docid,positions
+
+    def build_postings(self):
+        """
+        invert the self.BM25 dict (docid -> term -> score) into the postings (term -> (docid,score))
+        every posting list is sorted by the docid so it can be merged or skipped later
+        :return: None
+        """
+        self.postings = binindex.invert(self.BM25)
+
+    def build_tf_postings(self):
+        """
+        invert the tfs of the self.docdict into the postings (term -> (docid,tf)) for the raw statistics index
+        :return: None
+        """
+        self.postings = binindex.invert({docid:doc['tfs'] for docid,doc in self.docdict.items()})
 
-    def load_bm25(self):
+    def save_index(self):
+        """
+        save the self.postings inverted index to the binary index file
+        :return: None
+        """
+        # the statistics of the collection
+        stats = {'docs':self.totaldocsize,'average_doclen':self.average_doclen,
+                 'doclens':{docid:doc['len'] for docid,doc in self.docdict.items()}}
+        docids = [int(docid) for docid in self.docdict]
+        binindex.write_index(self.index_file,docids,self.postings,self.block_size,self.codec,self.quant_bits,
+                             self.weights,self.k,self.b,stats)
+        # the stems of the vocabulary are saved next to the index for the queries
+        if self.stem_cache.vocabulary:
+            self.stem_cache.save(self.stems_file)
+
+    def save_shards(self):
         """
-        load the self.BM25 model from the json file
+        save the self.postings to the shard index files, the documents are cut into contiguous docid ranges
+        every shard holds the statistics of the whole collection, the number of the documents, the average
+        length, the document frequencies and the range of the scores for the quantization,
+        so a document has the same score in its shard as in the one index of the whole collection
         :return: None
         """
-        with open(self.bm25_file,'r') as f:
-            self.BM25 = json.load(f)
+        scores = [posting[1] for plist in self.postings.values() for posting in plist]
+        stats = {'docs':self.totaldocsize,'average_doclen':self.average_doclen,
+                 'doclens':{docid:doc['len'] for docid,doc in self.docdict.items()},'dfs':self.idfs,
+                 'score_range':(min(scores),max(scores)) if scores else None}
+        for path,docids in zip(self.shard_files,sharding.split_docids(self.docdict,self.shards)):
+            postings = {}
+            if docids:
+                for term,plist in self.postings.items():
+                    # the posting lists are sorted by the docid, the shard is a slice of each
+                    start = bisect.bisect_left(plist,(docids[0],))
+                    end = bisect.bisect_left(plist,(docids[-1] + 1,))
+                    if start < end:
+                        postings[term] = plist[start:end]
+            binindex.write_index(path,docids,postings,self.block_size,self.codec,self.quant_bits,
+                                 self.weights,self.k,self.b,stats)
+        # the stems of the vocabulary are saved next to the index for the queries
+        if self.stem_cache.vocabulary:
+            self.stem_cache.save(self.stems_file)
+
+    def get_shard_files(self):
+        """
+        a get function for others to serve the shards
+        :return: the list of the paths of the shard index files, empty without shards
+        """
+        return self.shard_files
 
-    def get_BM25(self):
+    def load_index(self):
+        """
+        map the binary index file, the postings, the upper bounds and the blocks are read from it on demand
+        :return: None
         """
-        a get function to others to visit the BM25 dict
-        :return: the BM25 dict
+        self.index = binindex.BinaryIndex(self.index_file)
+        if self.index.weights == 'tf':
+            # the weights are computed from the raw statistics with the k and b asked for
+            self.scorer = scoring.QueryTimeBM25(self.index,self.k,self.b)
+            self.postings = self.scorer.postings
+            self.max_scores = self.scorer.max_scores
+            self.blocks = self.scorer.blocks
+        else:
+            self.postings = self.index.postings
+            self.max_scores = self.index.max_scores
+            self.blocks = self.index.blocks
+        self.totaldocsize = self.index.totaldocs
+        self.average_doclen = self.index.average_doclen
+        # the blocks were cut and the postings compressed when the index was built
+        self.block_size = self.index.block_size
+        self.codec = self.index.codec
+        self.quant_bits = self.index.quantizer.bits
+        # the stems of the vocabulary, it can be missing when the index file was copied alone
+        if os.path.exists(self.stems_file):
+            self.stem_cache.load(self.stems_file)
+
+    def get_postings(self):
+        """
+        a get function for others to visit the inverted index
+        :return: the postings dict
         """
-        return self.BM25
+        return self.postings
+
+    def get_max_scores(self):
+        """
+        a get function for others to visit the upper bound of every term
+        :return: the max_scores dict
+        """
+        return self.max_scores
+
+    def get_blocks(self):
+        """
+        a get function for others to visit the block upper bounds
+        :return: the blocks dict
+        """
+        return self.blocks
+
+    def get_block_size(self):
+        """
+        a get function for others to visit the block size of the index
+        :return: the block size
+        """
+        return self.block_size
+
+    def get_stem_cache(self):
+        """
+        a get function for others to share the stem cache
+        :return: the stem cache
+        """
+        return self.stem_cache
+
+    def get_index(self):
+        """
+        a get function for others to weigh the raw statistics with another k and b
+        :return: the binindex.BinaryIndex, None with the shards
+        """
+        return self.index
+
+    def get_positions(self):
+        """
+        a get function for others to match the phrases
+        :return: the positional.PositionalIndex, None when the positions were not asked for
+        """
+        return self.positions
+
+    def get_analyzer(self):
+        """
+        a get function for others to share the analyzer of the index
+        :return: the analyzer
+        """
+        return self.analyzer
+
+    def get_signature(self):
+        """
+        a get function for others to name the index on the disk, the headers of the index files hold the format,
+        the weights, the statistics of the collection and the size of every section, so they change with the index
+        :return: the list of the headers of the index files as hex strings
+        """
+        paths = self.shard_files or [self.index_file]
+        sizes = [binindex.HEADER.size] * len(paths)
+        if self.positions is not None:
+            paths = paths + [self.positions_file]
+            sizes.append(positional.HEADER.size)
+        signature = []
+        for path,size in zip(paths,sizes):
+            with open(path,'rb') as f:
+                signature.append(f.read(size).hex())
+        return signature
 
     def get_stopwords(self):
         """
@@ -240,6 +691,27 @@ class BM25(object):
         """
         return self.stopwords
 
+def _parse_shard(args):
+    """
+    the worker of the parallel index build, parse a shard of the documents
+    :param args: (the stopwords, a list of the doc info)
+    :return: the docdict, the idfs and the stems of the vocabulary of the shard, and its all terms length
+    """
+    stopwords,everydoc = args
+    # a BM25 with only the parts the parsing needs, it does not load or build an index
+    shard = BM25.__new__(BM25)
+    shard.stopwords = stopwords
+    shard.porter = porter.Stemmer()
+    shard.stem_cache = cache.StemCache(shard.porter)
+    shard.analyzer = analysis.Analyzer(shard.stem_cache,stopwords)
+    shard.docdict = {}
+    shard.idfs = {}
+    alldoclen = 0
+    for doc in everydoc:
+        alldoclen += shard._prase_doc(doc)
+    return shard.docdict,shard.idfs,shard.stem_cache.vocabulary,alldoclen
+
+
 class evaluation():
     """Summary of evaluation here
     the evaluation class is to evaluate the result of the BM25 model
@@ -248,21 +720,20 @@ class evaluation():
     prase the lisa.queries.txt for BM25 model
     prase the lisa.relevance.txt as ground truth
 
-    run the queries of the BM25 model
-    save the result to evaluation_output.txt
+    run the queries of the BM25 model into a runs.Run
 
-    calculate the several formula with the evaluation_output and the relevance
+    calculate the several formula with the run and the relevance
     like the precision,recall...
 
     """
-    def __init__(self):
+    def __init__(self,legacy=False):
 
+        # True for the legacy precision at n and average precision, see metrics.query_metrics
+        self.legacy = legacy
         # the path of the queries
         self.sample_query_file = './lisa/lisa.queries.txt'
         # the path of the relevance as ground truth
         self.gt = './lisa/lisa.relevance.txt'
-        # the paht of the stored evaluation file
-        self.output = 'evaluation_output.txt'
         # the query dict k:queryid v:query content list
         self.query = {}
         # the relevance dict k:queryid v:dict{k:rank,v:docid}
@@ -279,6 +750,8 @@ class evaluation():
         self.r_precision ={}
         # the single average precision dict k:queryid v: single average precision
         self.average_precision_single_query ={}
+        # the nDCG dict k:queryid v: nDCG number
+        self.ndcg ={}
         # the MAP　value
         self.map = 0
         # the average precision value
@@ -289,78 +762,29 @@ class evaluation():
         self.precision_at_n_mean=0
         # the average R precision value
         self.r_precision_mean =0
+        # the average nDCG value
+        self.ndcg_mean =0
 
-    def calculate_precision_recall(self,queryid,relevances,predictions):
-        """
-        calculate the precsions =relret/ret
-        calculate the recall = relret/rel
-        :param queryid: the specific id of the query
-        :param relevances: the specific query's relevance
-        :param predictions: the specific query's prediction
-        :return: None
-        """
-        ret = len(predictions)
-        rel = len(relevances)
-        relret = len(set(relevances.values()).intersection(set(predictions.values())))
-
-        self.precision[queryid] = relret * 1.0 / ret
-        self.recall[queryid] = relret * 1.0 / rel
-    def claculate_precision_at_n(self,n,queryid,relevances,predictions):
-        """
-        calculate the precsions_at_n by set the ret to n
-        :param n: the n of the formula
-        :param queryid: the specific id of the query
-        :param relevances: the specific query's relevance
-        :param predictions: the specific query's prediction
-        :return: None
-        """
-        ret = n
-        relret = 0
-        for i in predictions.values():
-            for k, v in relevances.items():
-                if i == v:
-                    relret+=1
-        self.precision_at_n[queryid] = relret /ret
-
-    def calculate_r_precsion(self,r,queryid,relevances,predictions):
-        """
-        calcualte the R recision of by claculate the recall every loop
-        :param r: the r of the formula
-        :param queryid: the specific id of the query
-        :param relevances: the specific query's relevance
-        :param predictions: the specific query's prediction
-        :return: None
-        """
-        rel = len(relevances)
-        ret = 1
-        relret = 0
-        for i in predictions.values():
-            if i in relevances.values():
-                relret+=1
-
-            if (relret / rel > r):
-                self.r_precision[queryid] = relret/ret
-                break
-
-            ret+=1
-
-    def calculate_average_precision_single_query(self,queryid,relevances,predictions):
+    def calculate_query(self,n,r,queryid,relevances,predictions,depth=None):
         """
-        calcualte the average precision of a single query
+        calculate every metric of a single query in one pass over its predictions
+        :param n: the n of the precision at n
+        :param r: the r of the R precision
         :param queryid: the specific id of the query
         :param relevances: the specific query's relevance
         :param predictions: the specific query's prediction
+        :param depth: the number of the results asked for, None if the predictions were not cut
         :return: None
         """
-        ret = 1
-        relret = 0
-        sum = 0
-        for i in predictions.values():
-            if i in relevances.values():
-                relret += 1
-                sum += relret / ret
-            ret += 1
-        self.average_precision_single_query[queryid] = sum / len(predictions)
+        result = metrics.query_metrics(set(relevances.values()),list(predictions.values()),n,r,self.legacy,depth)
+        self.precision[queryid] = result['precision']
+        self.recall[queryid] = result['recall']
+        self.precision_at_n[queryid] = result['precision_at_n']
+        # the query is not in the R precision when its recall never passes r
+        if result['r_precision'] is not None:
+            self.r_precision[queryid] = result['r_precision']
+        self.average_precision_single_query[queryid] = result['average_precision']
+        self.ndcg[queryid] = result['ndcg']
 
     def calcualte_map(self):
         """
@@ -370,16 +794,18 @@ class evaluation():
         self.map = self.calculate_average(self.average_precision_single_query.values())
 
 
-    def evaluation_all(self,n,r):
+    def evaluation_all(self,n,r,run,show=True):
         """
 
         :param n: the n of the formula
         :param r: the r of the formula
+        :param run: the runs.Run of the queries
+        :param show: if True the results are printed
         :return: None
         """
 
         # get the predictions dict
-        self.process_prediction_relevance()
+        self.process_prediction_relevance(run)
 
         # get the relevance dict
         self.process_example_relevance()
@@ -388,22 +814,18 @@ class evaluation():
         # self.relevance is a dict , k:queryid,v:dict(k:rank,v:docid)
         # self.prediction is a dict to ,k:queryid,v:dict(k:rank,v:docid)
         for queryid,relevances in self.relevance.items():
-            predictions = self.prediction[queryid]
-
-            # calcualte the precsion and recall
-            self.calculate_precision_recall(queryid,relevances,predictions)
-            # calculate the precision at n
-            self.claculate_precision_at_n(n,queryid,relevances,predictions)
-            # calcualte the R precision
-            self.calculate_r_precsion(r,queryid,relevances,predictions)
-            # calculate the singe average
-            self.calculate_average_precision_single_query(queryid,relevances,predictions)
+            # a query without a result has no prediction
+            predictions = self.prediction.get(queryid,{})
+
+            # calcualte the precsion, the recall, the precision at n, the R precision, the singe average and the nDCG
+            self.calculate_query(n,r,queryid,relevances,predictions,run.depth)
         # calculate the map
         self.calcualte_map()
         # calculate the all the value to the average across the collection
         self.calculate_all_average()
         # print the result to the screen
-        self.print_results()
+        if show:
+            self.print_results()
 
 
 
@@ -417,6 +839,7 @@ class evaluation():
         self.recall_mean = self.calculate_average(self.recall.values())
         self.precision_at_n_mean = self.calculate_average(self.precision_at_n.values())
         self.r_precision_mean = self.calculate_average(self.r_precision.values())
+        self.ndcg_mean = self.calculate_average(self.ndcg.values())
 
 
     def calculate_average(self,values):
@@ -443,8 +866,11 @@ class evaluation():
         print("{0:<21}{1:>.4f}".format('R-precision at R=0.4:', self.r_precision_mean))
         print("{0:<21}{1:>.4f}".format('Precision:',self.precision_mean))
         print("{0:<21}{1:>.4f}".format('Recall:',self.recall_mean))
-        print("{0:<21}{1:>.4f}".format('P@10:',self.precision_at_n_mean))
-        print("{0:<21}{1:>.4f}".format('MAP:',self.map))
+        # the legacy numbers are not the P@10 and the MAP, they are named so
+        legacy = ' (legacy)' if self.legacy else ''
+        print("{0:<21}{1:>.4f}".format('P@10{}:'.format(legacy),self.precision_at_n_mean))
+        print("{0:<21}{1:>.4f}".format('MAP{}:'.format(legacy),self.map))
+        print("{0:<21}{1:>.4f}".format('nDCG:',self.ndcg_mean))
 
     def process_example_query(self):
         """
@@ -470,56 +896,15 @@ class evaluation():
         # sorted_query = sorted(self.query.keys())
         return sorted_query
 
-    def save_result(self,queryid,sort_simBM25,total = 50):
-        """
-        save the evaluation result from the result
-        :param queryid: the specific query id
-        :param sort_simBM25: the result from the bm25model
-        :param total: the save number of the every query
-        :return: None
-        """
-        rank = 1
-        # self.prediction[queryid] = sort_simBM25
-        with open(self.output,'a') as f:
-            for result in sort_simBM25[:total]:
-                # wirte it to the file
-                f.write("{} {} {}\n".format(queryid,result[0],rank))
-                rank +=1
-
-    def process_prediction_relevance(self):
+    def process_prediction_relevance(self,run):
         """
-        open the evaluation output file
-        process the relevance of the prediction result
+        take the prediction of every query from the run, the results stay in memory from the query to the metrics
+        :param run: the runs.Run of the queries
         :return: None
         """
-        # open file
-        with open(self.output) as f:
-            result = f.read()
-
-            lines = filter(None,result.split('\n'))
-            rank = 1
+        for queryid,ranking in run.rankings().items():
             # queryresult dict k:rank v: docid
-            queryresult = {}
-
-            # read every line
-            for line in lines:
-                # get the queryid docid and queryrank
-                queryid , docid, queryrank = line.split(' ')
-                if rank != int(queryrank):
-                    rank = 1
-                    # add it to the prediction dict
-                    self.prediction[int(queryid)-1]=queryresult
-                    queryresult = {}
-                    queryresult[rank] = int(docid)
-                else:
-                    queryresult[rank] = int(docid)
-
-                rank +=1
-
-            # add the final queryresult
-            self.prediction[int(queryid)] = queryresult
-        # print(self.prediction)
-
+            self.prediction[queryid] = {rank:docid for rank,docid in enumerate(ranking,1)}
 
     def process_example_relevance(self):
         """
@@ -528,54 +913,14 @@ class evaluation():
         """
         # open the file
         with open(self.gt) as f:
-            sample_file = f.read()
-            sample_file = sample_file.split()
-            # print(sample_file)
             # three blocks here
-            # the third blocks length is defined by the second blocks
-            # the first block is the queryid
-            # start at 0 and 1
-            # prase here like a auto machine
-            id_block = True
-            num_block = False
-            relevance_block = False
-            relevance_content = {}
-            current_relevance = 0
-            count = 0
-            id = 0
-            i =0
-            while i<len(sample_file):
-                if id_block:
-                    # if not First:
-                    #
-                    # else:
-                    #     First = False
-                    id = int(sample_file[i])
-                    id_block = False
-                    num_block = True
-
-                elif num_block:
-                    count = int(sample_file[i])
-                    num_block = False
-                    relevance_block = True
-                elif relevance_block:
-                    if count == current_relevance :
-                        relevance_block = False
-                        current_relevance = 0
-                        i -=1
-                        # id_block = True
-                    else:
-                        current_relevance +=1
-                        relevance_content[current_relevance]= int(sample_file[i])
-                else:
-                    self.relevance[id] = relevance_content
-                    relevance_content = {}
-                    id_block = True
-                    i-=1
-                i+=1
-            self.relevance[id] = relevance_content
-
-
+            # the first block is the queryid, the second one is the number of the relevant documents
+            # and the third block is the docids of the relevant documents
+            values = iter(map(int,f.read().split()))
+        for id in values:
+            count = next(values)
+            # the relevance dict k:the order in the file v:docid
+            self.relevance[id] = {current_relevance:next(values) for current_relevance in range(1,count + 1)}
 
     def get_content(self):
         """
@@ -593,13 +938,78 @@ class search():
     get the argv of the user input
     if it is manual get into the query and result process
     if it is evaluation get into the evaluation result process
+    if it is batch score every query of the queries file
+    if it is serve answer the search requests over HTTP
     """
     def __init__(self):
 
-        # the BM25 model
-        self.model = {}
-        # the poter to stem the input
-        self.porter = porter.PorterStemmer()
+        # the corpus and the stopwords the model is built from
+        self.all_path = './lisa/lisa.all.txt'
+        self.stopwords_path = './stopwords.txt'
+        # the inverted index of the BM25 model k:term v:list of (docid,score)
+        self.postings = {}
+        # the max score of every term k:term v:score
+        self.max_scores = {}
+        # the evaluators can be chosen for the query
+        self.evaluators = ('taat','wand','maxscore','bmw','sparse')
+        # the evaluator to use, taat is the exhaustive one
+        self.evaluator = 'taat'
+        # the block size of the posting lists used by the bmw evaluator, None keeps the one of the index
+        self.block_size = None
+        # the block upper bounds k:term v:[block last docids,block max scores]
+        self.blocks = {}
+        # the codec of the docids and the bits of the scores when a new index is built, None keeps the ones of the index
+        self.codec = None
+        self.quant_bits = None
+        # the number of the processes to build a new index
+        self.workers = 1
+        # the number of the processes to score a list of queries
+        self.query_workers = 1
+        # the megabytes of the postings held in memory when a new index is built, 0 builds it all in memory
+        self.memory_budget = 0
+        # the number of the shards of the index, and the coordinator of their processes when there are more than 1
+        self.shards = 1
+        self.coordinator = None
+        # the file of the queries of the batch mode, one query a line, and the file of its results
+        self.queries_file = None
+        self.batch_output = 'batch_output.txt'
+        # the TREC run file the evaluation results are exported to and reused from, None keeps them in memory
+        self.run_file = None
+        # the headers of the index files, the run of the evaluation is only reused with the same index
+        self.signature = []
+        # 'tf' to build the index of the raw statistics, 'bm25' for the precomputed weights
+        self.weights = 'bm25'
+        # the k and b of the formula
+        self.k = 1
+        self.b = 0.75
+        # if True the evaluation prints the legacy precision at n and average precision
+        self.legacy_metrics = False
+        # if True every pruned result is checked against the exhaustive evaluation
+        self.check = False
+        # the sparse matrix of the index, built when the sparse evaluator is chosen
+        self.sparse = None
+        # the analyzer of the index, None until the model is loaded
+        self.analyzer = None
+        # the mapped index file, None until the model is loaded and with the shards
+        self.index = None
+        # the k1 and b grid of the sweep mode
+        self.sweep_k = [0.5,0.75,1.0,1.25,1.5,2.0]
+        self.sweep_b = [0.25,0.5,0.75,1.0]
+        # if True the positional index is built and loaded, the quotes of a query make the phrase clauses
+        self.positional = False
+        # the positional index, None until the model is loaded with the positions
+        self.positions = None
+        # the weight of the closeness of the matched phrases added to the score, 0 leaves the BM25 score
+        self.proximity = 0.0
+        # if True every term of a query is required, as if every word had a +
+        self.conjunctive = False
+        # the results of the recent queries k:(sorted terms,k) v:retrieval.TopK
+        self.result_cache = cache.LRUCache(1024)
+        # the address of the serve mode, the max number of the queries scored at once and the seconds a request may take
+        self.host = '127.0.0.1'
+        self.port = 8000
+        self.max_concurrency = 8
+        self.timeout = 10.0
 
     def search(self,argv):
         """
@@ -612,11 +1022,157 @@ class search():
             self._helper_msg()
             sys.exit(2)
         try:
-            opts,args = getopt.getopt(argv,"-h-m:")
+            opts,args = getopt.getopt(argv,"-h-m:-e:-c-w:-q:",["block-size=","codec=","quant-bits=","raw-stats","k1=","b=","query-workers=","result-cache=",
+                                                                   "host=","port=","max-concurrency=","timeout=","profile","memory-budget=","shards=",
+                                                                   "positions","proximity=","and","run=","sweep-k1=","sweep-b=","legacy-metrics"])
         except getopt.GetoptError:
             self._helper_msg()
             sys.exit(2)
 
+        # the settings are read first so they apply whatever order they are typed in
+        for opt,arg in opts:
+            if opt == '-e':
+                if arg not in self.evaluators:
+                    print("Can't Find the evaluator you have typed")
+                    self._helper_msg()
+                    sys.exit(2)
+                if arg == 'sparse' and not sparse.available():
+                    print("The sparse evaluator needs numpy, install it or choose another evaluator")
+                    sys.exit(2)
+                self.evaluator = arg
+            elif opt == '-c':
+                self.check = True
+            elif opt == '-w':
+                if not arg.isdigit() or int(arg) <= 0:
+                    print("The number of the workers must be a positive number")
+                    self._helper_msg()
+                    sys.exit(2)
+                self.workers = int(arg)
+            elif opt == '--query-workers':
+                if not arg.isdigit() or int(arg) <= 0:
+                    print("The number of the query workers must be a positive number")
+                    self._helper_msg()
+                    sys.exit(2)
+                self.query_workers = int(arg)
+            elif opt == '--result-cache':
+                if not arg.isdigit():
+                    print("The size of the result cache must be a number, 0 disables it")
+                    self._helper_msg()
+                    sys.exit(2)
+                self.result_cache = cache.LRUCache(int(arg))
+            elif opt == '--memory-budget':
+                if not arg.isdigit() or int(arg) <= 0:
+                    print("The memory budget must be a positive number of megabytes")
+                    self._helper_msg()
+                    sys.exit(2)
+                self.memory_budget = int(arg)
+            elif opt == '--shards':
+                if not arg.isdigit() or int(arg) <= 0:
+                    print("The number of the shards must be a positive number")
+                    self._helper_msg()
+                    sys.exit(2)
+                self.shards = int(arg)
+            elif opt == '--profile':
+                profiling.PROFILER.enabled = True
+            elif opt == '--positions':
+                self.positional = True
+            elif opt == '--and':
+                self.conjunctive = True
+            elif opt == '--proximity':
+                try:
+                    self.proximity = float(arg)
+                except ValueError:
+                    self.proximity = -1
+                if self.proximity < 0:
+                    print("The proximity boost must be a positive number")
+                    self._helper_msg()
+                    sys.exit(2)
+            elif opt == '--host':
+                self.host = arg
+            elif opt in ('--port','--max-concurrency'):
+                if not arg.isdigit() or int(arg) <= 0:
+                    print("The port and the max concurrency must be positive numbers")
+                    self._helper_msg()
+                    sys.exit(2)
+                if opt == '--port':
+                    self.port = int(arg)
+                else:
+                    self.max_concurrency = int(arg)
+            elif opt == '--timeout':
+                try:
+                    self.timeout = float(arg)
+                except ValueError:
+                    self.timeout = -1
+                if self.timeout <= 0:
+                    print("The timeout must be a positive number of seconds")
+                    self._helper_msg()
+                    sys.exit(2)
+            elif opt == '--legacy-metrics':
+                self.legacy_metrics = True
+            elif opt == '--run':
+                self.run_file = arg
+            elif opt in ('--sweep-k1','--sweep-b'):
+                try:
+                    values = [float(value) for value in arg.split(',')]
+                except ValueError:
+                    values = [-1]
+                if min(values) < 0 or (opt == '--sweep-b' and max(values) > 1):
+                    print("The grid is a list of numbers separated by commas, k1 must be positive and b between 0 and 1")
+                    self._helper_msg()
+                    sys.exit(2)
+                if opt == '--sweep-k1':
+                    self.sweep_k = values
+                else:
+                    self.sweep_b = values
+            elif opt == '-q':
+                if not os.path.exists(arg):
+                    print("Can't Find the queries file you have typed")
+                    sys.exit(2)
+                self.queries_file = arg
+            elif opt == '--raw-stats':
+                self.weights = 'tf'
+            elif opt in ('--k1','--b'):
+                try:
+                    value = float(arg)
+                except ValueError:
+                    value = -1
+                if value < 0 or (opt == '--b' and value > 1):
+                    print("k1 must be a positive number and b a number between 0 and 1")
+                    self._helper_msg()
+                    sys.exit(2)
+                if opt == '--k1':
+                    self.k = value
+                else:
+                    self.b = value
+            elif opt == '--block-size':
+                if not arg.isdigit() or int(arg) <= 0:
+                    print("The block size must be a positive number")
+                    self._helper_msg()
+                    sys.exit(2)
+                self.block_size = int(arg)
+            elif opt == '--codec':
+                if arg not in compression.CODECS:
+                    print("Can't Find the codec you have typed")
+                    self._helper_msg()
+                    sys.exit(2)
+                self.codec = arg
+            elif opt == '--quant-bits':
+                if not arg.isdigit() or int(arg) not in compression.QUANT_BITS:
+                    print("The scores can only be quantized to {} bits".format(compression.QUANT_BITS))
+                    self._helper_msg()
+                    sys.exit(2)
+                self.quant_bits = int(arg)
+        if self.shards > 1 and self.evaluator == 'sparse':
+            print("The sparse evaluator can't score the shards, choose another evaluator")
+            sys.exit(2)
+        if self.shards > 1 and self.query_workers > 1:
+            # a query worker would start the processes of the shards again, and a pool worker can't have children
+            print("The shards already score every query in their own processes, --query-workers can't be used with --shards")
+            sys.exit(2)
+        if self.shards > 1 and self.positional:
+            print("The phrases can't be matched on the shards, the positions need the whole index")
+            sys.exit(2)
+
         for opt,arg in opts:
             if opt == '-h':
                 self._helper_msg()
@@ -624,38 +1180,84 @@ class search():
                 # change to the manual
                 if arg == 'manual':
                     #load manual function
-                    model= BM25('./lisa/lisa.all.txt', './stopwords.txt')
-                    # set the model
-                    self.model = model.get_BM25()
-                    # set the stopwords
-                    self.stopwords = model.get_stopwords()
+                    self._load_model()
                     # start the process to query question
                     self.query()
                 # change to the evaluation
                 elif arg == 'evaluation':
                     #load evaluation function
-                    model = BM25('./lisa/lisa.all.txt', './stopwords.txt')
-                    # set the model
-                    self.model = model.get_BM25()
-                    # set the stopwords
-                    self.stopwords = model.get_stopwords()
+                    self._load_model()
                     # new the evaluation class
-                    e = evaluation()
-                    # judge if is need to generate the evaluation_output.txt
-                    if not os.path.exists('evaluation_output.txt'):
-                        id_and_words = e.process_example_query()
-
-                        for id,words in id_and_words:
-                            sort_simBM25=self._query_result(words)
-                            e.save_result(id,sort_simBM25,40)
+                    e = evaluation(self.legacy_metrics)
                     # evaluate all
-                    e.evaluation_all(10,0.4)
+                    e.evaluation_all(10,0.4,self.evaluation_run(e.process_example_query(),40))
+                # change to the sweep of k1 and b
+                elif arg == 'sweep':
+                    if self.shards > 1:
+                        print("The sweep weighs the whole index again at every point, it can't use the shards")
+                        sys.exit(2)
+                    # k1 and b are applied when the query runs, the index is the same for every point
+                    self.weights = 'tf'
+                    self._load_model()
+                    self.sweep()
+                # change to the batch of the queries file
+                elif arg == 'batch':
+                    if self.queries_file is None:
+                        print("The batch mode needs the queries file, give it with -q")
+                        self._helper_msg()
+                        sys.exit(2)
+                    self._load_model()
+                    self.batch()
+                # change to the query server
+                elif arg == 'serve':
+                    self._load_model()
+                    self.serve()
                 # others
                 else:
                     print("Can't Find the Command you have typed")
                     self._helper_msg()
                     sys.exit(2)
 
+        # the time of every stage of the indexing and the querying
+        if profiling.PROFILER.enabled:
+            print(profiling.PROFILER.report())
+
+    def _load_model(self):
+        """
+        load or build the BM25 model and set the parts used by the query
+        :return: None
+        """
+        model = BM25(self.all_path,self.stopwords_path,block_size=self.block_size,codec=self.codec,quant_bits=self.quant_bits,
+                     workers=self.workers,weights=self.weights,k=self.k,b=self.b,memory_budget=self.memory_budget * 1024 * 1024,
+                     shards=self.shards,positions=self.positional)
+        # set the inverted index
+        self.postings = model.get_postings()
+        # set the upper bound of every term
+        self.max_scores = model.get_max_scores()
+        # set the block upper bounds
+        self.blocks = model.get_blocks()
+        # the block size of the loaded index
+        self.block_size = model.get_block_size()
+        # share the analyzer and the stems of the index
+        self.analyzer = model.get_analyzer()
+        # the positional index of the phrases
+        self.positions = model.get_positions()
+        # the mapped index, the raw statistics can be weighed again with another k and b
+        self.index = model.get_index()
+        # name the index the results come from
+        self.signature = model.get_signature()
+        if self.coordinator is not None:
+            self.coordinator.close()
+            self.coordinator = None
+        if self.shards > 1:
+            # a process a shard, they load their index file once and score every query
+            self.coordinator = sharding.Coordinator(model.get_shard_files(),self.k,self.b)
+        elif self.evaluator == 'sparse':
+            # lay the postings out as the sparse matrix once, the queries only read it
+            self.sparse = sparse.SparseIndex(self.postings)
+        # the results of the index loaded before are stale
+        self.result_cache.clear()
+
     def query(self):
         """
         the interface of the query info
@@ -667,53 +1269,313 @@ class search():
         # continue until get quit
         while query_words != 'QUIT':
             # get the result
-            sort_simBM25=self._query_result(query_words)
+            sort_simBM25=self._query_result(query_words,15)
             # print the result
             self._print_query_result(sort_simBM25,query_words)
             # continue input
             query_words = input("Enter query:")
+        stats = self.result_cache.stats()
+        print("Result cache: {} hits, {} misses, {} evictions".format(stats['hits'],stats['misses'],stats['evictions']))
 
-    def _query_result(self,query_words):
+    def batch(self):
         """
-        preprocess the words
-        send to BM25 to find the score list
-        :param query_words: the words input to he system
-        :return:
+        score every line of the queries file and save the best 50 of every query to the batch output file,
+        a line of the output is the line number of the query, the docid and the rank
+        :return: None
         """
-        words = re.sub(r"[.(),?$%^*:\"\'/-]|[+——！，。？、~@#￥%……&*（）]", " ", query_words)
-        words = re.sub(r"\s+", " ", words)
-        words = words.lower().split(" ")
-
-        # get the useful word
-        temp_word_vector =[]
+        with open(self.queries_file) as f:
+            queries = [line.strip() for line in f]
+        results = self.search_many(queries,50,self.query_workers)
+        with open(self.batch_output,'w') as f:
+            for queryid,sort_simBM25 in enumerate(results,1):
+                for rank,result in enumerate(sort_simBM25,1):
+                    f.write("{} {} {}\n".format(queryid,result[0],rank))
+        print("The results of {} queries are saved to {}".format(len(queries),self.batch_output))
+
+    def evaluation_run(self,id_and_words,k):
+        """
+        score the queries of the evaluation into a run, the run file is reused when its tag is the one
+        of the current index, queries and parameters, otherwise the queries are scored and the run is exported
+        :param id_and_words: the list of (queryid,the words input to the system)
+        :param k: the number of the results of every query
+        :return: the runs.Run
+        """
+        # the evaluator is not in the tag, every evaluator gives the results of the exhaustive one
+        tag = runs.run_tag({'index':self.signature,'queries':id_and_words,'k':k,'k1':self.k,'b':self.b,
+                            'positional':self.positional,'proximity':self.proximity,'conjunctive':self.conjunctive})
+        # the run file is written when it is missing, empty or was made by this program
+        export = self.run_file is not None
+        if export and os.path.exists(self.run_file) and os.path.getsize(self.run_file):
+            run = runs.Run.load(self.run_file)
+            if run is not None and run.tag == tag:
+                print("The results are reused from {}".format(self.run_file))
+                # the depth is in the tag
+                run.depth = k
+                return run
+            if run is not None and run.made_here():
+                print("{} was made by another index or other parameters, the queries will be scored again".format(self.run_file))
+            else:
+                print("{} is not a run of this program, it is left as it is and the results are not exported".format(self.run_file))
+                export = False
+        run = runs.Run(tag,k)
+        # the queries are scored together so the sparse evaluator can batch them
+        results = self.search_many([words for id,words in id_and_words],k,self.query_workers)
+        for (id,words),sort_simBM25 in zip(id_and_words,results):
+            run.add(id,sort_simBM25)
+        if export:
+            run.save(self.run_file)
+            print("The results of {} queries are saved to {}".format(len(run),self.run_file))
+        return run
+
+    def sweep(self):
+        """
+        evaluate the queries of the evaluation at every point of the k1 and b grid and print a table of the metrics,
+        the points are shared by self.query_workers processes which map the same index of the raw statistics
+        and weigh it with the k1 and b of their point, the index is not built again
+        :return: None
+        """
+        points = [(k,b) for k in self.sweep_k for b in self.sweep_b]
+        id_and_words = evaluation().process_example_query()
+        if self.query_workers <= 1 or len(points) <= 1:
+            results = [self._sweep_point(k,b,id_and_words) for k,b in points]
+        else:
+            with multiprocessing.Pool(min(self.query_workers,len(points)),_init_query_worker,(self._worker_settings(),)) as pool:
+                results = pool.map(_sweep_point,[(k,b,id_and_words) for k,b in points])
+        legacy = '*' if self.legacy_metrics else ''
+        print("{0:>6}{1:>6}{2:>9}{3:>9}{4:>9}{5:>9}".format('k1','b','MAP'+legacy,'P@10'+legacy,'R-prec','nDCG'))
+        for (k,b),result in zip(points,results):
+            print("{0:>6.2f}{1:>6.2f}{2:>9.4f}{3:>9.4f}{4:>9.4f}{5:>9.4f}".format(k,b,result['map'],result['precision_at_n'],
+                                                                              result['r_precision'],result['ndcg']))
+        (k,b),result = max(zip(points,results),key=lambda item: item[1]['map'])
+        if self.legacy_metrics:
+            print("* the legacy definitions, see --legacy-metrics")
+        print("The best MAP{} {:.4f} is at k1={} b={}".format(legacy,result['map'],k,b))
+
+    def _sweep_point(self,k,b,id_and_words):
+        """
+        evaluate the queries with another k1 and b, the mapped index is weighed again and not read again
+        :param k: the k1 of the point
+        :param b: the b of the point
+        :param id_and_words: the list of (queryid,the words input to the system)
+        :return: a dict of the mean metrics of the point
+        """
+        self.k = k
+        self.b = b
+        scorer = scoring.QueryTimeBM25(self.index,k,b)
+        self.postings = scorer.postings
+        self.max_scores = scorer.max_scores
+        self.blocks = scorer.blocks
+        if self.evaluator == 'sparse':
+            self.sparse = sparse.SparseIndex(self.postings)
+        # the results of the other points are stale
+        self.result_cache.clear()
+        run = runs.Run(None,40)
+        for (id,words),sort_simBM25 in zip(id_and_words,self._query_results([words for id,words in id_and_words],40)):
+            run.add(id,sort_simBM25)
+        e = evaluation(self.legacy_metrics)
+        e.evaluation_all(10,0.4,run,False)
+        return {'map':e.map,'precision_at_n':e.precision_at_n_mean,'r_precision':e.r_precision_mean,'ndcg':e.ndcg_mean}
+
+    def search_many(self,queries,k=None,workers=1):
+        """
+        score a list of queries with a pool of processes, every process loads the index once
+        the queries are cut into contiguous chunks, so the results come back in the order of the queries
+        :param queries: the list of the words input to the system
+        :param k: the number of the results of every query, None for all the matched documents
+        :param workers: the number of the processes, 1 scores the queries in this process
+        :return: the list of the retrieval.TopK in the order of the queries
+        """
+        if self.analyzer is None:
+            self._load_model()
+        if workers <= 1 or len(queries) <= 1:
+            return self._query_results(queries,k)
+        # a few chunks a worker, so a slow chunk doesn't hold the others
+        size = max(1,math.ceil(len(queries) / (workers * 4)))
+        chunks = [(queries[start:start + size],k) for start in range(0,len(queries),size)]
+        with multiprocessing.Pool(workers,_init_query_worker,(self._worker_settings(),)) as pool:
+            results = []
+            for chunk in pool.map(_query_chunk,chunks):
+                results.extend(chunk)
+        return results
+
+    def serve(self):
+        """
+        serve the JSON search requests over HTTP until the process is interrupted, the index is already loaded
+        the queries are scored in a thread, or in self.query_workers processes which load the index once each
+        :return: None
+        """
+        if self.query_workers > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(self.query_workers,initializer=_init_query_worker,
+                                                              initargs=(self._worker_settings(),))
+            score = _query_one
+            stats = None
+        else:
+            # one thread, the index and the caches are not shared between threads
+            executor = concurrent.futures.ThreadPoolExecutor(1)
+            score = self._query_result
+            stats = self.result_cache.stats
+        max_concurrency = self.max_concurrency
+        if self.query_workers > 1 and max_concurrency > self.query_workers:
+            # a process scores a query at a time, more slots would only queue the queries in the executor
+            max_concurrency = self.query_workers
+            print("{} queries are scored at once, one a query worker".format(max_concurrency))
+        server.QueryServer(score,executor,self.host,self.port,max_concurrency,self.timeout,15,stats).run()
+
+    def _worker_settings(self):
+        """
+        the settings which choose the index and the evaluator of a query worker process,
+        the index file exists when they are asked
+        :return: a dict of the search attributes
+        """
+        return {'all_path':self.all_path,'stopwords_path':self.stopwords_path,'evaluator':self.evaluator,'block_size':self.block_size,'codec':self.codec,
+                'quant_bits':self.quant_bits,'weights':self.weights,'k':self.k,'b':self.b,'check':self.check,
+                'shards':self.shards,'positional':self.positional,'legacy_metrics':self.legacy_metrics,'proximity':self.proximity,'conjunctive':self.conjunctive,
+                'result_cache':cache.LRUCache(self.result_cache.maxsize)}
 
-        for word in words:
-            if word not in self.stopwords:
-                word = self.porter.stem(word)
+    def _query_terms(self,query_words):
+        """
+        preprocess the words of a query into the unique stemmed terms, the phrase clauses and the required terms
+        :param query_words: the words input to he system
+        :return: the list of the terms in the query order, the tuple of the clauses (terms,window) in a fixed order,
+                 the window is None for a phrase and the clauses are empty without the positional index,
+                 and the sorted tuple of the terms every result must have
+        """
+        with profiling.PROFILER.stage('query.analyze'):
+            clauses = set()
+            required = set()
+            if self.positions is not None:
+                # the quotes are the punctuation without the positions
+                query_words,phrases = analysis.split_phrases(query_words)
+                for phrase,window in phrases:
+                    terms = self.analyzer.analyze(phrase)
+                    if window is not None:
+                        # the order of the terms doesn't matter in a window
+                        terms = sorted(set(terms))
+                    if terms:
+                        clauses.add((tuple(terms),window))
+            # the +word must be in every result, a stopword requires nothing
+            query_words,words = analysis.split_required(query_words)
+            for word in words:
+                required.update(self.analyzer.analyze(word))
+            # the repeated terms are kept once, in the order they first come
+            temp_word_vector = list(dict.fromkeys(self.analyzer.analyze(query_words)))
+            if self.conjunctive:
+                required.update(temp_word_vector)
+        clauses = tuple(sorted(clauses,key=lambda clause: (clause[0],-1 if clause[1] is None else clause[1])))
+        return temp_word_vector,clauses,tuple(sorted(required))
+
+    def _query_key(self,query_words,k):
+        """
+        the key of the result cache, the spellings with the same terms and clauses share it
+        :param query_words: the words input to he system
+        :param k: the number of the results
+        :return: (the sorted terms, the clauses, the required terms, k)
+        """
+        terms,clauses,required = self._query_terms(query_words)
+        return tuple(sorted(terms)),clauses,required,k
 
-                if word in temp_word_vector:
-                    continue
-                else:
-                    temp_word_vector.append(word)
-        # the similarity of the BM25
-        simBM25={}
-
-        # get all for the model
-        for docid,value in self.model.items():
-            # set the score to 0
-            score = 0
-
-            for words in temp_word_vector:
-                # if the words in the model sum the score
-                if words in value:
-                    score += value[words]
-            # add to the simBM25 dict
-            simBM25[docid] = score
-        # sorted the dict and return the result
-        sort_simBM25 = sorted(simBM25.items(),key=lambda item:item[1],reverse= True)
+    def _query_result(self,query_words,k=None):
+        """
+        preprocess the words
+        send to BM25 to find the score list, the result of a query asked before comes from the result cache
+        :param query_words: the words input to he system
+        :param k: the number of the results to return, None for all the matched documents
+        :return: a retrieval.TopK list of (docid,score), shorter than k if fewer documents matched
+        """
+        # the spellings with the same terms share the key, and the terms are scored in the order of the key
+        # so the cached result is always the one a new evaluation would give
+        key = self._query_key(query_words,k)
+        sort_simBM25 = self.result_cache.get(key)
+        if sort_simBM25 is None:
+            sort_simBM25 = self._evaluate(list(key[0]),k,query_words,key[1],key[2])
+            self.result_cache.put(key,sort_simBM25)
+        return sort_simBM25
 
+    def _query_results(self,queries,k=None):
+        """
+        score a list of queries, the sparse evaluator scores the queries not in the result cache in batches
+        and the others score them one by one
+        :param queries: the list of the words input to the system
+        :param k: the number of the results of every query, None for all the matched documents
+        :return: the list of the retrieval.TopK in the order of the queries
+        """
+        if self.evaluator != 'sparse':
+            return [self._query_result(query_words,k) for query_words in queries]
+        keys = [self._query_key(query_words,k) for query_words in queries]
+        results = [self.result_cache.get(key) for key in keys]
+        # the queries with the phrases or the required terms are matched one by one
+        for i,key in enumerate(keys):
+            if results[i] is None and (key[1] or key[2]):
+                results[i] = self._evaluate(list(key[0]),k,queries[i],key[1],key[2])
+                self.result_cache.put(key,results[i])
+        missing = [i for i,sort_simBM25 in enumerate(results) if sort_simBM25 is None]
+        with profiling.PROFILER.stage('query.score'):
+            scored = self.sparse.query_many([list(keys[i][0]) for i in missing],k)
+        for i,sort_simBM25 in zip(missing,scored):
+            self._check_result(sort_simBM25,list(keys[i][0]),k,queries[i])
+            self.result_cache.put(keys[i],sort_simBM25)
+            results[i] = sort_simBM25
+        return results
+
+    def _evaluate(self,temp_word_vector,k,query_words,clauses=(),required=()):
+        """
+        score the documents with the chosen evaluator
+        :param temp_word_vector: the list of the unique query terms
+        :param k: the number of the results to return, None for all the matched documents
+        :param query_words: the words input to the system, for the error message of the check
+        :param clauses: the phrase and the proximity clauses (terms,window) every result must match
+        :param required: the terms every result must have
+        :return: a retrieval.TopK list of (docid,score)
+        """
+        if clauses:
+            # only the documents which match every clause are scored, they are exact so there is nothing to check
+            with profiling.PROFILER.stage('query.phrase'):
+                matches = self.positions.match(clauses)
+            if required:
+                with profiling.PROFILER.stage('query.intersect'):
+                    docids = retrieval.intersect([self.postings.get(term,()) for term in required])
+                matches = {docid:matches[docid] for docid in docids if docid in matches}
+            with profiling.PROFILER.stage('query.score'):
+                scores = retrieval.score_documents(self.postings,temp_word_vector,matches)
+                if self.proximity:
+                    for docid,closeness in matches.items():
+                        scores[docid] += self.proximity * closeness
+            return retrieval.top_k(scores,k)
+        with profiling.PROFILER.stage('query.score'):
+            if self.coordinator is not None:
+                # every shard scores the query, the coordinator merges their top k
+                sort_simBM25 = self.coordinator.query(temp_word_vector,k,self.evaluator,required)
+            elif self.evaluator == 'sparse' and not required:
+                sort_simBM25 = self.sparse.query(temp_word_vector,k)
+            else:
+                # with the required terms the posting lists are intersected whatever the evaluator
+                sort_simBM25 = retrieval.evaluate(self.evaluator,self.postings,self.max_scores,self.blocks,self.block_size,
+                                                  temp_word_vector,k,required)
+
+        if required:
+            # the intersection is scored exactly, there is nothing to check
+            return sort_simBM25
+
+        self._check_result(sort_simBM25,temp_word_vector,k,query_words)
         return sort_simBM25
 
+    def _check_result(self,sort_simBM25,temp_word_vector,k,query_words):
+        """
+        the pruned or the sparse result must be exactly the exhaustive one, it is only checked with -c
+        :param sort_simBM25: the result of the chosen evaluator
+        :param temp_word_vector: the terms of the query
+        :param k: the number of the results
+        :param query_words: the words input to the system
+        :return: None
+        """
+        if self.check and self.evaluator != 'taat':
+            if self.coordinator is not None:
+                expected = self.coordinator.query(temp_word_vector,k,'taat')
+            else:
+                expected = retrieval.taat(self.postings,temp_word_vector,k)
+            if list(sort_simBM25) != list(expected):
+                raise RuntimeError("the {} result differs from the exhaustive result for the query [{}]".format(self.evaluator,query_words))
+
     def _print_query_result(self,sort_simBM25,query_words):
         """
         the interface to print the result of a search
@@ -722,6 +1584,8 @@ class search():
         :return: None
         """
         print('Results for query [{}]'.format(query_words))
+        if sort_simBM25.fewer_than_k:
+            print('Only {} documents match the query'.format(len(sort_simBM25)))
         rank = 1
         # printed = False
         for result in sort_simBM25[:15]:
@@ -741,6 +1605,94 @@ class search():
         print("usage:")
         print("search.py -m manual")
         print("serach.py -m evaluation")
+        print("search.py -m batch -q FILE")
+        print("search.py -m serve")
+        print("search.py -m sweep")
+        print("options:")
+        print("-e taat|wand|maxscore|bmw   the query evaluator, taat is exhaustive, the others skip the documents can't enter the top k")
+        print("-e sparse                   score with the numpy sparse matrix, the evaluation queries are scored in one batch")
+        print("-w N                        build a new index with N processes, 1 by default")
+        print("-q FILE                     the queries file of the batch mode, one query a line")
+        print("--query-workers=N           score the evaluation or the batch queries with N processes, 1 by default")
+        print("--result-cache=N            keep the results of the N most recent queries, 1024 by default, 0 disables it")
+        print("--host=H --port=N           the address of the serve mode, 127.0.0.1:8000 by default")
+        print("--max-concurrency=N         the max number of the queries the server admits at once, 8 by default, with")
+        print("                            --query-workers it is at most the number of the query workers")
+        print("--timeout=S                 the seconds a request to the server may take, 10 by default")
+        print("--shards=N                  cut the index into N shards built in memory, a process a shard scores every query")
+        print("                            and their top k are merged, the scores are the ones of the whole index")
+        print("--positions                 build and load the positional index, then \"a b\" in a query only matches the documents")
+        print("                            with the phrase and \"a b\"~N the ones with at most N other words between the terms")
+        print("--and                       only the documents with every term of the query match, +word in a query")
+        print("                            requires that word alone, the results are ranked by BM25")
+        print("--run=FILE                  export the results of the evaluation to the TREC run FILE, the next evaluation")
+        print("                            reuses it when it was made by the same index, queries and parameters")
+        print("--sweep-k1=K,K --sweep-b=B,B  the grid of the sweep mode, every k1 with every b, the points are evaluated by")
+        print("                            the query workers which share the index of the raw statistics, BM25Index.tf.bin")
+        print("--legacy-metrics            the P@10 of the whole ranking and the MAP over the returned documents, the numbers")
+        print("                            the evaluation printed before")
+        print("--proximity=W               add W times the closeness of the phrases to the score, 0 by default")
+        print("--profile                   print the time and the calls of every stage of the indexing and the querying,")
+        print("                            the stages run in the worker processes are not counted")
+        print("-c                          check the result of the evaluator is the same as the exhaustive one")
+        print("--block-size=N              the number of the postings in a block for bmw, 64 for a new index by default,")
+        print("                            an index with another block size is built again")
+        print("--codec=raw|varint|bitpack  the compression of the docids when the index is built, raw for a new index")
+        print("--quant-bits=0|8|16         quantize the scores when the index is built, 0 keeps the exact scores")
+        print("                            an index with another codec or other bits is built again")
+        print("--memory-budget=MB          build a new index out of core, the postings over MB megabytes go to sorted runs on the disk,")
+        print("                            the documents are parsed by one process")
+        print("--raw-stats                 use the index of the raw statistics, BM25Index.tf.bin, k1 and b are applied when")
+        print("                            the query runs")
+        print("--k1=K --b=B                the k1 and b of the formula, 1 and 0.75 by default")
+
+
+# the search of a query worker process, it is loaded once by _init_query_worker
+_worker_search = None
+
+
+def _init_query_worker(settings):
+    """
+    the initializer of a query worker process, load the index once for all the queries of the worker
+    :param settings: the dict of the search attributes which choose the index and the evaluator
+    :return: None
+    """
+    global _worker_search
+    # the loading messages were already printed by the main process
+    sys.stdout = open(os.devnull,'w')
+    _worker_search = search()
+    _worker_search.__dict__.update(settings)
+    _worker_search._load_model()
+
+
+def _query_chunk(args):
+    """
+    the worker of search_many, score a chunk of the queries
+    :param args: (a list of the words input to the system, the number of the results)
+    :return: the list of the retrieval.TopK in the order of the queries
+    """
+    queries,k = args
+    return _worker_search._query_results(queries,k)
+
+
+def _sweep_point(args):
+    """
+    the worker of the sweep mode, evaluate the queries at a point of the grid
+    :param args: (the k1,the b,the list of (queryid,the words input to the system))
+    :return: the dict of the mean metrics of the point
+    """
+    k,b,id_and_words = args
+    return _worker_search._sweep_point(k,b,id_and_words)
+
+
+def _query_one(query_words,k):
+    """
+    the worker of the serve mode, score a query
+    :param query_words: the words input to the system
+    :param k: the number of the results
+    :return: the retrieval.TopK of the query
+    """
+    return _worker_search._query_result(query_words,k)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit, parse_qs
+
+# the reason phrases of the status codes the server sends
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 408: 'Request Timeout',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+           504: 'Gateway Timeout'}
+# the largest request body accepted, a query is a few words
+MAX_BODY = 64 * 1024
+# the largest k of a request
+MAX_K = 1000
+
+
+class HTTPError(Exception):
+    """the error sent back to the client with its status code"""
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class QueryServer(object):
+    """Summary of QueryServer here
+    serve the JSON search requests over HTTP with asyncio, the index is loaded once before the server starts
+        GET  /search?q=words&k=15
+        POST /search  {"query": "words", "k": 15}
+        GET  /stats
+    the scoring is CPU bound so it runs in the executor and a slow query doesn't stall the event loop,
+    at most max_concurrency queries are scored at once, the others wait for a slot, it should not be more than
+    the workers of the executor or the queries queue in the executor, a slot is held until the scoring of its
+    query ends, even when the request timed out, so the executor never has more than max_concurrency queries,
+    a request which can't be read in timeout seconds gets 408, one which can't be answered in time
+    gets 503 if it never got a slot and 504 otherwise,
+    an error of the scoring gets 500
+    every response closes the connection
+    """
+
+    def __init__(self, score, executor, host='127.0.0.1', port=8000, max_concurrency=8, timeout=10.0,
+                 default_k=15, stats=None):
+        # the function (query words, k) -> retrieval.TopK, it is called in the executor
+        self.score = score
+        # the concurrent.futures executor which runs the scoring
+        self.executor = executor
+        self.host = host
+        self.port = port
+        # the max number of the queries scored at once
+        self.max_concurrency = max_concurrency
+        # the seconds a request may take, from the first byte read to the result
+        self.timeout = timeout
+        # the k of a request which doesn't give one
+        self.default_k = default_k
+        # the function which returns a dict of the counters of the search, None if it has none
+        self.extra_stats = stats
+        # the counters of the server
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.slots = None
+
+    def run(self):
+        """
+        serve until the process is interrupted
+        :return: None
+        """
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def _serve(self):
+        # the semaphore must be made in the loop of the server
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print("Serving on http://{}:{}/search".format(self.host, self.port))
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        """
+        answer a connection, read one request and send one response
+        :param reader: the asyncio.StreamReader of the connection
+        :param writer: the asyncio.StreamWriter of the connection
+        :return: None
+        """
+        self.requests += 1
+        deadline = time.monotonic() + self.timeout
+        try:
+            try:
+                method, target, body = await asyncio.wait_for(self._read_request(reader), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise HTTPError(408, 'the request was not read in {} seconds'.format(self.timeout))
+            status, payload = 200, await self._route(method, target, body, deadline)
+        except HTTPError as error:
+            status, payload = error.status, {'error': str(error)}
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            status, payload = 504, {'error': 'the request took more than {} seconds'.format(self.timeout)}
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+        except Exception as error:
+            # the client always gets an answer, whatever failed in the scoring
+            status, payload = 500, {'error': '{}: {}'.format(type(error).__name__, error)}
+        if status != 200:
+            self.errors += 1
+        data = json.dumps(payload).encode('utf-8')
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                     "Connection: close\r\n\r\n".format(status, REASONS[status], len(data)).encode('latin-1') + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _read_request(self, reader):
+        """
+        read the request line, the headers and the body
+        :param reader: the asyncio.StreamReader of the connection
+        :return: (the method, the target, the body bytes)
+        """
+        line = await reader.readline()
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise HTTPError(400, 'malformed request line')
+        method, target = parts[0], parts[1]
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                if not value.strip().isdigit():
+                    raise HTTPError(400, 'malformed Content-Length')
+                length = int(value)
+        if length > MAX_BODY:
+            raise HTTPError(413, 'the body is larger than {} bytes'.format(MAX_BODY))
+        body = await reader.readexactly(length) if length else b''
+        return method, target, body
+
+    async def _route(self, method, target, body, deadline):
+        """
+        dispatch a request on its path
+        :param method: the HTTP method
+        :param target: the path and the query string
+        :param body: the body bytes
+        :param deadline: the time.monotonic() the response is due
+        :return: the JSON payload of the response
+        """
+        url = urlsplit(target)
+        if url.path == '/stats':
+            if method != 'GET':
+                raise HTTPError(405, 'use GET for /stats')
+            return self.stats()
+        if url.path != '/search':
+            raise HTTPError(404, 'unknown path {}'.format(url.path))
+        if method == 'GET':
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            query_words = params.get('q')
+            k = params.get('k', self.default_k)
+        elif method == 'POST':
+            try:
+                params = json.loads(body.decode('utf-8'))
+            except ValueError:
+                raise HTTPError(400, 'the body is not JSON')
+            if not isinstance(params, dict):
+                raise HTTPError(400, 'the body must be a JSON object')
+            query_words = params.get('query')
+            k = params.get('k', self.default_k)
+        else:
+            raise HTTPError(405, 'use GET or POST for /search')
+        if not isinstance(query_words, str) or not query_words.strip():
+            raise HTTPError(400, 'the query is missing')
+        if isinstance(k, str) and k.strip().isdigit():
+            k = int(k)
+        elif isinstance(k, float) and k.is_integer():
+            k = int(k)
+        # True is an int, a bool is not a number of the results and 2.7 is not truncated
+        if isinstance(k, bool) or not isinstance(k, int):
+            k = -1
+        if k <= 0 or k > MAX_K:
+            raise HTTPError(400, 'k must be a positive number up to {}'.format(MAX_K))
+        sort_simBM25 = await self._score(query_words, k, deadline)
+        return {'query': query_words, 'k': k, 'fewer_than_k': sort_simBM25.fewer_than_k,
+                'results': [{'rank': rank, 'docid': int(docid), 'score': float(score)}
+                            for rank, (docid, score) in enumerate(sort_simBM25, 1)]}
+
+    async def _score(self, query_words, k, deadline):
+        """
+        wait for a slot and score the query in the executor
+        :param query_words: the words of the query
+        :param k: the number of the results
+        :param deadline: the time.monotonic() the response is due
+        :return: the retrieval.TopK of the query
+        """
+        try:
+            await asyncio.wait_for(self.slots.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPError(503, 'the server is busy, {} queries are being scored'.format(self.in_flight))
+        self.in_flight += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.score, query_words, k)
+        except BaseException:
+            self._release(None)
+            raise
+        # the scoring can't be stopped once it runs, the slot is given back when it ends, not when the request times out
+        future.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.shield(future), max(deadline - time.monotonic(), 0))
+
+    def _release(self, future):
+        """
+        give the slot of a query back when its scoring ends
+        :param future: the future of the scoring, None if it never started
+        :return: None
+        """
+        self.in_flight -= 1
+        self.slots.release()
+        if future is not None and not future.cancelled():
+            # the error of a timed out query has no request to go to, it is read so it isn't logged
+            future.exception()
+
+    def stats(self):
+        """
+        the counters of the server, and of the search if it has some
+        :return: a dict of the counters
+        """
+        stats = {'requests': self.requests, 'errors': self.errors, 'timeouts': self.timeouts,
+                 'in_flight': self.in_flight, 'max_concurrency': self.max_concurrency, 'timeout': self.timeout}
+        if self.extra_stats is not None:
+            stats['search'] = self.extra_stats()
+        return stats
@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import traceback
+
+import binindex
+import retrieval
+import scoring
+
+
+def shard_files(index_file, shards):
+    """
+    the paths of the index files of the shards
+    :param index_file: the path of the index file of the whole collection
+    :param shards: the number of the shards
+    :return: a list of the paths, BM25Index.bin gives BM25Index.shard0of4.bin ...
+    """
+    root, ext = os.path.splitext(index_file)
+    return ["{}.shard{}of{}{}".format(root, i, shards, ext) for i in range(shards)]
+
+
+def split_docids(docids, shards):
+    """
+    cut the docids into contiguous ranges of about the same size,
+    the gaps between the docids of a shard stay small so they compress as well as in the whole index
+    :param docids: the docids of the collection
+    :param shards: the number of the shards
+    :return: a list of the sorted docid lists, one a shard
+    """
+    docids = sorted(docids)
+    return [docids[len(docids) * i // shards:len(docids) * (i + 1) // shards] for i in range(shards)]
+
+
+def _serve_shard(conn, path, k, b):
+    """
+    the worker process of a shard, load the index of the shard once and answer the queries until None comes
+    a query is (the terms, the number of the results, the evaluator, the required terms), the answer is the TopK of the shard
+    or the text of the error
+    :param conn: the connection to the coordinator
+    :param path: the path of the index file of the shard
+    :param k: the k of the formula, used by the tf weights
+    :param b: the b of the formula, used by the tf weights
+    :return: None
+    """
+    index = binindex.BinaryIndex(path)
+    if index.weights == 'tf':
+        # the header and the document frequencies of the shard hold the statistics of the whole collection
+        scorer = scoring.QueryTimeBM25(index, k, b)
+        postings, max_scores, blocks = scorer.postings, scorer.max_scores, scorer.blocks
+    else:
+        postings, max_scores, blocks = index.postings, index.max_scores, index.blocks
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        terms, topk, evaluator, required = message
+        try:
+            result = retrieval.evaluate(evaluator, postings, max_scores, blocks, index.block_size, terms, topk, required)
+        except Exception:
+            result = RuntimeError("shard {}: {}".format(path, traceback.format_exc()))
+        conn.send(result)
+    index.close()
+
+
+class Coordinator(object):
+    """Summary of Coordinator here
+    the scatter gather search over the shards of a collection, every shard is an independent index
+    served by its own process, a query is sent to every shard and the top k of the shards are merged
+    the shards were written with the statistics of the whole collection (the number of the documents,
+    the average document length and the document frequencies), so every document has the same score
+    as in the one index of the whole collection, and the merged top k is the same
+    the shards talk through multiprocessing connections, a shard on another host only needs a
+    multiprocessing.connection.Client in place of the pipe
+    """
+
+    def __init__(self, paths, k=1, b=0.75):
+        # the paths of the index files of the shards
+        self.paths = paths
+        self.connections = []
+        self.processes = []
+        for path in paths:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, args=(child, path, k, b), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def query(self, terms, k=None, evaluator='taat', required=()):
+        """
+        score the query on every shard and merge the results
+        :param terms: the list of the unique query terms
+        :param k: the number of the results, None to rank all the matches
+        :param evaluator: 'taat', 'wand', 'maxscore' or 'bmw', the evaluator of every shard
+        :param required: the terms every result must have, empty for the OR of the terms
+        :return: a retrieval.TopK list of (docid,score)
+        """
+        # scatter first so the shards score at the same time, then gather
+        for conn in self.connections:
+            conn.send((terms, k, evaluator, required))
+        results = [conn.recv() for conn in self.connections]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return retrieval.merge_top_k(results, k)
+
+    def close(self):
+        """
+        stop the processes of the shards
+        :return: None
+        """
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except (OSError, EOFError):
+                pass
+            conn.close()
+        for process in self.processes:
+            process.join(1)
+        self.connections = []
+        self.processes = []
@@ -0,0 +1,139 @@
+import retrieval
+
+try:
+    import numpy as np
+except ImportError:
+    # the sparse engine is optional, the dict engines in retrieval don't need numpy
+    np = None
+
+
+def available():
+    """
+    check the sparse engine can be used
+    :return: True if numpy is installed
+    """
+    return np is not None
+
+
+class SparseIndex(object):
+    """Summary of SparseIndex here
+    the index as a sparse doc x term matrix in the compressed sparse column (CSC) layout,
+    the column of a term is the slice indptr[col]:indptr[col+1] of the rows (the document positions)
+    and of the data (the scores), the documents are numbered in the order of their docid
+    a query is scored with one vectorised accumulation over the columns of its terms,
+    a batch of queries with one product of the query x term matrix and the doc x term matrix,
+    the columns are added in the order of the query terms so the scores are the same to the last bit
+    as retrieval.taat, and the best k are selected with argpartition instead of sorting all the scores
+    """
+
+    def __init__(self, postings, batch_size=8):
+        if np is None:
+            raise ImportError("the sparse engine needs numpy")
+        # the number of the queries scored by one product, the batch x docs score matrix
+        # should stay in the cache, on LISA 8 queries are faster than all 35 together
+        self.batch_size = batch_size
+        # the column of every term k:term v:column number
+        self.columns = {}
+        docids = []
+        scores = []
+        lengths = []
+        for term in postings:
+            plist = postings[term]
+            if not plist:
+                continue
+            self.columns[term] = len(lengths)
+            lengths.append(len(plist))
+            docids.extend(posting[0] for posting in plist)
+            scores.extend(posting[1] for posting in plist)
+        # the sorted docids, the row of a document is its position here
+        self.docids = np.unique(np.array(docids, dtype=np.int64))
+        self.ndocs = len(self.docids)
+        self.indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        self.rows = np.searchsorted(self.docids, np.array(docids, dtype=np.int64))
+        self.data = np.array(scores, dtype=np.float64)
+
+    def _gather(self, terms, offset=0):
+        """
+        gather the rows and the scores of the columns of the terms, in the order of the terms
+        :param terms: the list of the unique query terms
+        :param offset: added to the rows, it puts the query on its own row of the batch
+        :return: (the list of the rows arrays, the list of the scores arrays)
+        """
+        rows = []
+        data = []
+        for term in terms:
+            col = self.columns.get(term)
+            if col is None:
+                continue
+            start, end = self.indptr[col], self.indptr[col + 1]
+            rows.append(self.rows[start:end] + offset if offset else self.rows[start:end])
+            data.append(self.data[start:end])
+        return rows, data
+
+    def query(self, terms, k=None):
+        """
+        score a query with the vectorised accumulation of its columns
+        :param terms: the list of the unique query terms
+        :param k: the number of the results, None to rank all the matches
+        :return: a retrieval.TopK list of (docid,score), the same as retrieval.taat
+        """
+        rows, data = self._gather(terms)
+        if not rows:
+            return retrieval.top_k({}, k)
+        rows = np.concatenate(rows)
+        # bincount adds the weights in the order they come, so every score is summed in the query order
+        scores = np.bincount(rows, weights=np.concatenate(data), minlength=self.ndocs)
+        matched = np.bincount(rows, minlength=self.ndocs) > 0
+        return self._top_k(scores, matched, k)
+
+    def query_many(self, queries, k=None):
+        """
+        score a batch of queries, every batch_size queries are scored by one sparse product
+        :param queries: a list of the lists of the unique query terms
+        :param k: the number of the results of every query, None to rank all the matches
+        :return: a list of the retrieval.TopK in the order of the queries
+        """
+        results = []
+        ndocs = self.ndocs
+        for start in range(0, len(queries), self.batch_size):
+            batch = queries[start:start + self.batch_size]
+            rows = []
+            data = []
+            for i, terms in enumerate(batch):
+                # the query i of the batch owns the rows i*ndocs:(i+1)*ndocs of the flat score matrix
+                query_rows, query_data = self._gather(terms, i * ndocs)
+                rows.extend(query_rows)
+                data.extend(query_data)
+            if not rows:
+                results.extend(retrieval.top_k({}, k) for _ in batch)
+                continue
+            rows = np.concatenate(rows)
+            size = len(batch) * ndocs
+            scores = np.bincount(rows, weights=np.concatenate(data), minlength=size).reshape(len(batch), ndocs)
+            matched = (np.bincount(rows, minlength=size) > 0).reshape(len(batch), ndocs)
+            for i in range(len(batch)):
+                results.append(self._top_k(scores[i], matched[i], k))
+        return results
+
+    def _top_k(self, scores, matched, k):
+        """
+        select the best k matched documents, higher score first and the smaller docid wins the tie
+        :param scores: the array of the scores of every document
+        :param matched: the array of True for the documents which have a query term
+        :param k: the number of the results, None to rank all the matches
+        :return: a retrieval.TopK list of (docid,score)
+        """
+        if k is not None and k <= 0:
+            return retrieval.TopK([], k)
+        rows = np.flatnonzero(matched)
+        values = scores[rows]
+        if k is not None and k < len(rows):
+            # the k-th best score, the documents tied with it are kept so the docid can break the tie
+            kth = values[np.argpartition(-values, k - 1)[k - 1]]
+            keep = values >= kth
+            rows = rows[keep]
+            values = values[keep]
+        # lexsort sorts by the last key first
+        order = np.lexsort((rows, -values))[:k]
+        return retrieval.TopK(zip(self.docids[rows[order]].tolist(), values[order].tolist()), k)
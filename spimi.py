@@ -0,0 +1,182 @@
+import array
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from itertools import groupby
+
+# the estimated bytes of a posting held in a block, its docid and its tf in two arrays of 4 byte integers
+POSTING_BYTES = 8
+# the estimated bytes of a term of a block, the dict entry, the key and the two arrays
+TERM_BYTES = 200
+# the estimated bytes of the array of the positions of a posting, without the positions, and of a position
+POSITIONS_BYTES = 72
+POSITION_BYTES = 4
+
+
+def _term_key(record):
+    """the order of the terms in a run and in the index, the order of their utf-8 bytes"""
+    return record[0].encode('utf-8')
+
+
+def _read_run(path):
+    """
+    read the records of a run one at a time
+    :param path: the path of the run file
+    :return: a generator of (term, the docids array, the tfs array)
+    """
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+class SpimiBuilder(object):
+    """Summary of SpimiBuilder here
+    the single pass in memory indexing (SPIMI) of a collection larger than the memory
+    the postings of the documents are added to an in memory block k:term v:(docids,tfs) until the
+    estimated size of the block passes the memory budget, then the block is sorted by the term and
+    flushed to a run file and a new block starts
+    merge() reads every run at once and yields the posting lists term by term in the order of the index,
+    so at no time more than a block and a posting list are in memory
+        with SpimiBuilder(budget, directory) as builder:
+            for docid, tfs in documents:
+                builder.add(docid, tfs)
+            for term, docids, tfs in builder.merge():
+                ...
+    """
+
+    def __init__(self, budget, directory='.'):
+        # the max estimated bytes of a block
+        self.budget = budget
+        # the directory of the run files, it is removed on close
+        self.directory = tempfile.mkdtemp(prefix='spimi', dir=directory)
+        # the paths of the runs in the order they were flushed
+        self.runs = []
+        self.block = {}
+        self.size = 0
+        # the last docid added, and False once a docid came after a larger one
+        self.last = -1
+        self.ordered = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add(self, docid, tfs):
+        """
+        add the postings of a document, the documents come in the order of the collection
+        :param docid: the docid
+        :param tfs: the tfs of the document k:term v:frequency
+        :return: None
+        """
+        if docid <= self.last:
+            self.ordered = False
+        self.last = docid
+        block = self.block
+        for term, freq in tfs.items():
+            entry = block.get(term)
+            if entry is None:
+                entry = block[term] = (array.array('I'), self._values())
+                self.size += TERM_BYTES
+            entry[0].append(docid)
+            entry[1].append(freq)
+        self.size += self._size(tfs)
+        if self.size >= self.budget:
+            self.flush()
+
+    def _values(self):
+        """
+        the empty list of the values of the postings of a term
+        :return: an array of the tfs
+        """
+        return array.array('I')
+
+    def _size(self, tfs):
+        """
+        the estimated bytes the postings of a document add to the block
+        :param tfs: the tfs of the document k:term v:frequency
+        :return: the number of the bytes
+        """
+        return POSTING_BYTES * len(tfs)
+
+    def flush(self):
+        """
+        write the block to a new run sorted by the term, and start an empty block
+        :return: None
+        """
+        if not self.block:
+            return
+        path = os.path.join(self.directory, 'run{:06d}'.format(len(self.runs)))
+        with open(path, 'wb') as f:
+            for term in sorted(self.block, key=lambda term: term.encode('utf-8')):
+                docids, tfs = self.block[term]
+                pickle.dump((term, docids, tfs), f, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+        self.block = {}
+        self.size = 0
+
+    def merge(self):
+        """
+        k-way merge the runs, the posting lists of a term are joined in the order of the runs
+        :return: a generator of (term, the docids array, the values of the postings) in the order of the index,
+                 every posting list sorted by the docid, the values are the tfs array
+        """
+        self.flush()
+        # heapq.merge keeps the order of the runs for the same term, so the postings stay in the collection order
+        records = heapq.merge(*[_read_run(path) for path in self.runs], key=_term_key)
+        for term, group in groupby(records, key=lambda record: record[0]):
+            docids = array.array('I')
+            values = self._values()
+            for record in group:
+                docids.extend(record[1])
+                values.extend(record[2])
+            if not self.ordered:
+                # the collection was not in the docid order
+                order = sorted(range(len(docids)), key=docids.__getitem__)
+                docids = array.array('I', [docids[i] for i in order])
+                ordered = self._values()
+                ordered.extend(values[i] for i in order)
+                values = ordered
+            yield term, docids, values
+
+    def close(self):
+        """
+        remove the run files
+        :return: None
+        """
+        self.block = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class PositionsBuilder(SpimiBuilder):
+    """Summary of PositionsBuilder here
+    the SpimiBuilder of the positional index, the value of a posting is the array of the positions
+    of the term in the document in place of its tf, the blocks and the runs are the same
+        with PositionsBuilder(budget, directory) as builder:
+            for docid, positions in documents:
+                builder.add(docid, positions)
+            for term, docids, positions in builder.merge():
+                ...
+    """
+
+    def _values(self):
+        """
+        the empty list of the values of the postings of a term
+        :return: a list of the position arrays
+        """
+        return []
+
+    def _size(self, positions):
+        """
+        the estimated bytes the postings of a document add to the block
+        :param positions: the positions of the document k:term v:the array of the positions
+        :return: the number of the bytes
+        """
+        return sum(POSTING_BYTES + POSITIONS_BYTES + POSITION_BYTES * len(plist) for plist in positions.values())
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# the modules of the search are at the top of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import search  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def lisa(tmp_path_factory):
+    """
+    the BM25 model of the LISA collection, built once in a temporary directory for every test
+    :return: the loaded search.BM25
+    """
+    directory = tmp_path_factory.mktemp('lisa')
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        model = search.BM25(os.path.join(ROOT, 'lisa', 'lisa.all.txt'), os.path.join(ROOT, 'stopwords.txt'))
+    finally:
+        os.chdir(cwd)
+    return model
@@ -0,0 +1,36 @@
+import pytest
+
+import metrics
+
+
+def test_perfect_ranking():
+    relevant = set(range(1, 13))
+    result = metrics.query_metrics(relevant, list(range(1, 13)) + list(range(100, 128)), depth=40)
+    assert result['precision_at_n'] == 1.0
+    assert result['average_precision'] == pytest.approx(1.0)
+    assert result['ndcg'] == pytest.approx(1.0)
+    assert result['recall'] == 1.0
+
+
+def test_ndcg_does_not_reward_a_short_ranking():
+    relevant = set(range(1, 11))
+    short = metrics.query_metrics(relevant, [1], depth=40)
+    padded = metrics.query_metrics(relevant, [1] + list(range(100, 139)), depth=40)
+    assert short['ndcg'] == pytest.approx(padded['ndcg'])
+    assert short['ndcg'] < 0.25
+
+
+def test_ndcg_without_a_cutoff_is_over_every_relevant_document():
+    ideal = sum(1 / metrics.math.log2(rank + 1) for rank in range(1, 11))
+    assert metrics.query_metrics(set(range(1, 11)), [1])['ndcg'] == pytest.approx(1 / ideal)
+
+
+def test_legacy_definitions():
+    relevant = set(range(1, 13))
+    result = metrics.query_metrics(relevant, list(range(1, 13)) + list(range(100, 128)), legacy=True, depth=40)
+    assert result['precision_at_n'] == pytest.approx(1.2)
+    assert result['average_precision'] == pytest.approx(0.3)
+
+
+def test_r_precision_never_reached():
+    assert metrics.query_metrics({1, 2, 3}, [5, 6, 7], depth=3)['r_precision'] is None
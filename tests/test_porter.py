@@ -0,0 +1,31 @@
+import os
+import re
+
+import porter
+from conftest import ROOT
+
+
+def lisa_words():
+    """
+    the words of the LISA documents and queries, as the index sees them and with their punctuation
+    :return: the sorted list of the unique words
+    """
+    words = set()
+    for name in ('lisa.all.txt', 'lisa.queries.txt'):
+        with open(os.path.join(ROOT, 'lisa', name)) as f:
+            text = f.read().lower()
+        words.update(re.sub(r"[.(),?$%^*:\"\'/-]|[+——！，。？、~@#￥%……&*（）]", " ", text).split())
+        words.update(text.split())
+    return sorted(words)
+
+
+def test_stemmer_is_porter_stemmer_on_lisa():
+    words = lisa_words()
+    expected = [porter.PorterStemmer().stem(word) for word in words]
+    assert porter.Stemmer().stem_many(words) == expected
+
+
+def test_stemmer_departures():
+    stemmer = porter.Stemmer()
+    for word in ('sky', 'news', 'generalization', 'hopeful', 'librarian', 'libraries', 'a', ''):
+        assert stemmer.stem(word) == porter.PorterStemmer().stem(word)
@@ -0,0 +1,23 @@
+import pytest
+
+import retrieval
+
+# librari is in most of the LISA documents, its idf and so its weights are negative
+QUERIES = ['library', 'library computer', 'information retrieval systems in the library',
+           'the use of computers in school libraries for children',
+           'online catalogue searching by subject headings of the catalog']
+
+
+@pytest.mark.parametrize('evaluator', ['wand', 'maxscore', 'bmw'])
+@pytest.mark.parametrize('k', [1, 2, 10, 40, 200])
+@pytest.mark.parametrize('query', QUERIES)
+def test_pruned_top_k_is_taat(lisa, evaluator, k, query):
+    terms = sorted(set(lisa.get_analyzer().analyze(query)))
+    expected = retrieval.taat(lisa.get_postings(), terms, k)
+    result = retrieval.evaluate(evaluator, lisa.get_postings(), lisa.get_max_scores(), lisa.get_blocks(),
+                                lisa.get_block_size(), terms, k)
+    assert list(result) == list(expected)
+
+
+def test_librari_is_negative(lisa):
+    assert lisa.get_max_scores()['librari'] < 0
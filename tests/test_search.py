@@ -0,0 +1,11 @@
+import pytest
+
+import search
+
+
+@pytest.mark.parametrize('mode', ['evaluation', 'batch', 'serve'])
+def test_shards_with_query_workers_is_rejected(mode, capsys):
+    with pytest.raises(SystemExit) as exit:
+        search.search().search(['-m', mode, '--shards=2', '--query-workers=2'])
+    assert exit.value.code == 2
+    assert '--query-workers' in capsys.readouterr().out
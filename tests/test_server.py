@@ -0,0 +1,87 @@
+import asyncio
+import concurrent.futures
+import json
+
+import pytest
+
+import retrieval
+import server
+
+
+class Writer(object):
+    """the part of asyncio.StreamWriter the server uses, it keeps what is written"""
+
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def request(query_server, data):
+    """
+    send the bytes of a request to the server
+    :return: (the status, the JSON payload)
+    """
+    async def handle():
+        query_server.slots = asyncio.Semaphore(query_server.max_concurrency)
+        reader = asyncio.StreamReader()
+        if data is not None:
+            reader.feed_data(data)
+            reader.feed_eof()
+        writer = Writer()
+        await query_server._handle(reader, writer)
+        return writer.data
+
+    head, _, body = asyncio.run(handle()).partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body.decode('utf-8'))
+
+
+def post(query_server, payload):
+    body = json.dumps(payload).encode('utf-8')
+    return request(query_server, b'POST /search HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+
+
+@pytest.fixture
+def query_server():
+    def score(query_words, k):
+        if query_words == 'fail':
+            raise RuntimeError('the evaluator is wrong')
+        return retrieval.TopK([(1, 2.0), (2, 1.0)][:k], k)
+
+    executor = concurrent.futures.ThreadPoolExecutor(1)
+    yield server.QueryServer(score, executor, timeout=0.2)
+    executor.shutdown()
+
+
+def test_search(query_server):
+    status, payload = post(query_server, {'query': 'library', 'k': 1})
+    assert status == 200
+    assert payload['results'] == [{'rank': 1, 'docid': 1, 'score': 2.0}]
+
+
+@pytest.mark.parametrize('k', [2.7, 1e400, True, 0, -3, server.MAX_K + 1, '2.7', [2]])
+def test_bad_k_is_rejected(query_server, k):
+    status, payload = post(query_server, {'query': 'library', 'k': k})
+    assert status == 400
+
+
+def test_integral_k(query_server):
+    assert post(query_server, {'query': 'library', 'k': 2.0})[0] == 200
+    assert request(query_server, b'GET /search?q=library&k=2 HTTP/1.1\r\n\r\n')[0] == 200
+
+
+def test_scoring_error_is_500(query_server):
+    status, payload = post(query_server, {'query': 'fail'})
+    assert status == 500
+    assert 'RuntimeError' in payload['error']
+
+
+def test_unread_request_is_408(query_server):
+    assert request(query_server, None)[0] == 408